@@ -0,0 +1,187 @@
+# offline end to end benchmark: runs the real place_orders and scrape_tracking against a local fake fnet
+# site, a local ftp server (pyftpdlib), a local smtp server and an in memory sheet, and reports orders/hour, tracking
+# lookups/second and peak memory. needs chrome for the order phase, like a real run.
+# usage: python -m benchmarks.bench_end_to_end [--orders N] [--latency S] [--workers N] [--results FILE]
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import threading
+from benchmarks.fake_fnet import FakeFnetSite
+from benchmarks.fake_sheet import FakeSheet
+from benchmarks.fake_smtp import FakeSmtpServer
+
+FTP_USER = 'bench'
+FTP_PASS = 'bench'
+
+ORDER_COLUMNS = [
+    "PO_num", "First Name", "Last Name", "Ship To Address", "Ship To Address 2",
+    "Ship To City", "Ship To State", "Ship To Zip", "SKU", "Qty",
+]
+
+def start_ftp_server(root):
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(FTP_USER, FTP_PASS, root, perm='elradfmwMT')
+    handler = type('BenchFTPHandler', (FTPHandler,), {'authorizer': authorizer})
+    server = ThreadedFTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, kwargs={'handle_exit': False}, name='fake-ftp', daemon=True).start()
+    return server
+
+# order csvs in the ftp orders dir, items_per_order lines per PO drawn from a small sku pool
+def write_order_files(orders_dir, orders, files, items_per_order, skus):
+    random.seed(42)
+    pool = [str(400000 + i) for i in range(skus)]
+    for file_index in range(files):
+        with open(os.path.join(orders_dir, f"bench_orders_{file_index}.csv"), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(ORDER_COLUMNS)
+            for order_index in range(file_index, orders, files):
+                for sku in random.sample(pool, min(items_per_order, len(pool))):
+                    writer.writerow([
+                        f"BENCH{order_index:05d}", "Pat", "Bench", f"{order_index} Main St", "",
+                        "Springfield", "IL", "62701", sku, random.randint(1, 2),
+                    ])
+
+# peak resident memory in MB, this process and its reaped children (chrome)
+def peak_memory_mb():
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024 # ru_maxrss is bytes on macOS, KB on linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+def last_run_summary(state_dir, kind):
+    timings_dir = os.path.join(state_dir, 'step_timings')
+    runs = sorted(f for f in os.listdir(timings_dir) if f.startswith(kind)) if os.path.isdir(timings_dir) else []
+    if not runs:
+        return None
+    with open(os.path.join(timings_dir, runs[-1])) as f:
+        return json.loads(f.read().splitlines()[-1])['summary']
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=20, help='POs to place')
+    parser.add_argument('--files', type=int, default=2, help='order files the POs are spread over')
+    parser.add_argument('--items', type=int, default=2, help='line items per PO')
+    parser.add_argument('--skus', type=int, default=10, help='distinct skus, fewer means more sku cache hits')
+    parser.add_argument('--tracking-orders', type=int, default=200, help='extra sheet rows waiting for tracking')
+    parser.add_argument('--latency', type=float, default=0.2, help='fake site seconds per response')
+    parser.add_argument('--sheet-latency', type=float, default=0.1, help='fake sheet seconds per call')
+    parser.add_argument('--order-failure-rate', type=float, default=0.0)
+    parser.add_argument('--tracking-failure-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=1, help='checkout browsers (NUM_WORKERS)')
+    parser.add_argument('--tracking-rps', type=float, help='TRACKING_REQUESTS_PER_SECOND, defaults to the configured limit')
+    parser.add_argument('--skip-orders', action='store_true', help='tracking phase only, no chrome needed')
+    parser.add_argument('--skip-tracking', action='store_true')
+    parser.add_argument('--results', help='append the results as one json line to this file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='fnetbot-bench-')
+    ftp_root = os.path.join(work_dir, 'ftp')
+    local_orders_dir = os.path.join(work_dir, 'orders')
+    state_dir = os.path.join(work_dir, 'state')
+    for path in (os.path.join(ftp_root, 'out', 'orders', 'archive'), os.path.join(ftp_root, 'in', 'inventory'), local_orders_dir):
+        os.makedirs(path)
+    if not args.skip_orders:
+        write_order_files(os.path.join(ftp_root, 'out', 'orders'), args.orders, args.files, args.items, args.skus)
+
+    site = FakeFnetSite(args.latency, args.order_failure_rate, args.tracking_failure_rate).start()
+    ftp_server = start_ftp_server(ftp_root)
+    ftp_host, ftp_port = ftp_server.address[:2]
+    smtp_server = FakeSmtpServer().start()
+    smtp_host, smtp_port = smtp_server.address
+    sheet = FakeSheet([[f"OLD{i:05d}", str(47000000 + i)] for i in range(args.tracking_orders)], latency=args.sheet_latency)
+
+    # settings are read when the bot's modules are imported, so they must be in place first
+    os.environ.update({
+        'FTP_HOST': ftp_host, 'FTP_PORT': str(ftp_port), 'FTP_USER': FTP_USER, 'FTP_PASS': FTP_PASS,
+        'LOCAL_ORDERS_DIR': local_orders_dir, 'STATE_DIR': state_dir,
+        'LOGIN_URL': f"{site.url}/login", 'CHECKOUT_PAGE_URL': f"{site.url}/checkout",
+        'CART_PAGE_URL': f"{site.url}/cart",
+        'TRACKING_BASE_URL': f"{site.url}/tracking/",
+        'LOGIN_USERNAME': 'bench', 'LOGIN_PASSWORD': 'bench',
+        'CC_NUM': '4111111111111111', 'CC_EXP_NUM': '03/30', 'CC_CSV': '737',
+        'NUM_WORKERS': str(args.workers), 'TRACKING_FIRST_CHECK_HOURS': '0',
+        'SMTP_HOST': smtp_host, 'SMTP_PORT': str(smtp_port), 'SMTP_STARTTLS': '0', 'EMAIL_PASSWORD': '',
+        'SENDER_EMAIL': 'bot@bench.local', 'RECEIVER_EMAIL': 'ops@bench.local',
+    })
+    for worker_id in range(1, args.workers):
+        os.environ[f'LOGIN_USERNAME_{worker_id}'] = f'bench{worker_id}' # one account per worker
+        os.environ[f'LOGIN_PASSWORD_{worker_id}'] = 'bench'
+    if args.tracking_rps is not None:
+        os.environ['TRACKING_REQUESTS_PER_SECOND'] = str(args.tracking_rps)
+
+    import main as bot
+    from scrape_tracking import scrape_tracking
+    from utils.log_setup import setup_logging
+
+    setup_logging()
+
+    results = {'ts': time.time(), 'args': vars(args)}
+    try:
+        if not args.skip_orders:
+            start = time.perf_counter()
+            successful, failed = bot.place_orders(sheet=sheet)
+            seconds = time.perf_counter() - start
+            summary = last_run_summary(state_dir, 'orders') or {}
+            results['orders'] = {
+                'successful': successful,
+                'failed': failed,
+                'seconds': round(seconds, 1),
+                'orders_per_hour': round(successful * 3600 / seconds, 1) if seconds else 0,
+                'steps': {step: {'p50': s['p50'], 'p95': s['p95']} for step, s in summary.get('steps', {}).items()},
+            }
+
+        if not args.skip_tracking:
+            requests_before = site.counts.get('GET tracking', 0)
+            start = time.perf_counter()
+            scrape_tracking(sheet=sheet)
+            seconds = time.perf_counter() - start
+            lookups = site.counts.get('GET tracking', 0) - requests_before
+            results['tracking'] = {
+                'lookups': lookups,
+                'failed_lookups': site.counts.get('tracking_failures', 0),
+                'seconds': round(seconds, 2),
+                'lookups_per_second': round(lookups / seconds, 1) if seconds else 0,
+                'rows_with_tracking': sum(1 for row in sheet.rows[1:] if len(row) > 3 and row[3]),
+            }
+    finally:
+        bot.outbox.close()
+        site.stop()
+        ftp_server.close_all()
+        smtp_server.stop()
+
+    own_mb, children_mb = peak_memory_mb()
+    results['peak_memory_mb'] = {'bot': own_mb, 'children': children_mb}
+    results['sheet_calls'] = sheet.calls
+    results['site_requests'] = site.counts
+    results['emails'] = {'subjects': smtp_server.subjects(), 'smtp_connections': smtp_server.connections}
+
+    if 'orders' in results:
+        o = results['orders']
+        print(f"orders: {o['successful']} placed, {o['failed']} failed in {o['seconds']} s = {o['orders_per_hour']} orders/hour")
+        for step, s in sorted(o['steps'].items(), key=lambda item: item[1]['p95'], reverse=True):
+            print(f"  {step:<32}p50 {s['p50']:>7.3f} s  p95 {s['p95']:>7.3f} s")
+    if 'tracking' in results:
+        t = results['tracking']
+        print(f"tracking: {t['lookups']} lookups ({t['failed_lookups']} failed) in {t['seconds']} s = "
+              f"{t['lookups_per_second']} lookups/second, {t['rows_with_tracking']} rows with tracking")
+    print(f"peak memory: {own_mb} MB bot, {children_mb} MB largest child process")
+    print(f"sheet calls: {sheet.calls}")
+    print(f"emails: {results['emails']['subjects']} over {smtp_server.connections} smtp connections")
+    print(f"state and downloaded files kept in {work_dir}")
+
+    if args.results:
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(results) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# compares the fast tracking page scan against the BeautifulSoup parse over saved pages
+# usage: python -m benchmarks.bench_tracking_parse [--fixtures DIR] [--iterations N]
+import os
+import time
+import argparse
+import tracemalloc
+from utils.tracking_parser import parse_tracking_fast, parse_tracking_soup
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'tracking')
+
+PARSERS = {
+    'fast': parse_tracking_fast,
+    'soup': parse_tracking_soup,
+}
+
+def time_parser(parse, page, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse(page)
+    return (time.perf_counter() - start) / iterations
+
+def peak_memory(parse, page):
+    tracemalloc.start()
+    parse(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='directory of saved tracking pages (.html)')
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.fixtures) if f.endswith('.html'))
+    if not files:
+        print(f"no .html fixtures in {args.fixtures}")
+        return
+
+    print(f"{'page':<28}{'parser':<8}{'ms/page':>10}{'peak KiB':>12}  result")
+    totals = {name: 0.0 for name in PARSERS}
+    for file_name in files:
+        with open(os.path.join(args.fixtures, file_name), encoding='utf-8') as f:
+            page = f.read()
+
+        results = {}
+        for name, parse in PARSERS.items():
+            seconds = time_parser(parse, page, args.iterations)
+            totals[name] += seconds
+            results[name] = parse(page)
+            print(f"{file_name:<28}{name:<8}{seconds * 1000:>10.3f}{peak_memory(parse, page) / 1024:>12.1f}  {results[name]}")
+
+        if results['fast'] is not None and results['fast'] != results['soup']:
+            print(f"  mismatch on {file_name}: fast={results['fast']} soup={results['soup']}")
+
+    if totals['fast']:
+        print(f"\nfast scan is {totals['soup'] / totals['fast']:.1f}x faster than BeautifulSoup over {len(files)} pages")
+
+if __name__ == '__main__':
+    main()
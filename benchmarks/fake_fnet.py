@@ -0,0 +1,301 @@
+# local stand-in for the fnet site: login, search, product, cart, checkout with the three
+# payment iframes, confirmation and tracking pages, with the element ids checkout.py and login.py use.
+# every response is delayed by `latency` seconds (+-50% jitter) and orders / tracking lookups
+# fail at the configured rates
+import html
+import time
+import random
+import secrets
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+US_STATES = [
+    "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA", "HI", "ID", "IL", "IN", "IA", "KS", "KY",
+    "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ", "NM", "NY", "NC", "ND",
+    "OH", "OK", "OR", "PA", "RI", "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY", "DC",
+]
+PAYMENT_FIELDS = {'card': 'encryptedCardNumber', 'expiry': 'encryptedExpiryDate', 'cvc': 'encryptedSecurityCode'}
+CARRIERS = ["UPS", "USPS", "FedEx"]
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{title} | FragranceNet</title></head>
+<body>
+<header>
+  {welcome}
+  <form action="/search" method="get"><input id="searchInput" name="mv_searchspec" type="text"></form>
+</header>
+<main>
+{body}
+</main>
+</body>
+</html>
+"""
+
+CHECKOUT = """<form id="checkoutForm" method="post" action="/order">
+  <div id="shippingFields">
+    <input id="fname" name="fname"><input id="lname" name="lname">
+    <input id="address1" name="address1"><input id="address2" name="address2">
+    <input id="zip" name="zip"><input id="city" name="city">
+    <select id="ship_state_drop" name="state">{states}</select>
+    <button id="shippingProceedButton" type="button">Continue to shipping</button>
+  </div>
+  <div id="shippingOptions" style="display:none">
+    <label><input type="radio" id="DSP" name="ship_method" value="DSP"> Dropship</label>
+    <button id="proceedCheckButton" type="button">Continue to payment</button>
+  </div>
+  <div id="payment"></div>
+  <button id="submitOrder" type="submit" style="display:none">Place order</button>
+</form>
+<script>
+var delay = {delay_ms};
+document.getElementById('shippingProceedButton').onclick = function () {{
+  setTimeout(function () {{ document.getElementById('shippingOptions').style.display = 'block'; }}, delay);
+}};
+document.getElementById('proceedCheckButton').onclick = function () {{
+  setTimeout(function () {{
+    var payment = document.getElementById('payment');
+    ['card', 'expiry', 'cvc'].forEach(function (field) {{
+      var frame = document.createElement('iframe');
+      frame.className = 'js-iframe';
+      frame.src = '/pay/' + field;
+      payment.appendChild(frame);
+    }});
+    document.getElementById('submitOrder').style.display = 'inline-block';
+  }}, delay);
+}};
+</script>
+"""
+
+TRACKING = """<div class="panel">
+  <h2 class="panel-title">Order #{order_number}</h2>
+  <p><strong>Order Status:</strong> Shipped</p>
+  <p><strong>Shipment Vendor:</strong> {carrier}</p>
+  <p><strong>Shipment Tracking #:</strong> <a href="https://example.com/track/{tracking}" target="_blank">{tracking}</a></p>
+</div>
+"""
+
+class FakeFnetSite:
+    def __init__(self, latency=0.2, order_failure_rate=0.0, tracking_failure_rate=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.order_failure_rate = order_failure_rate
+        self.tracking_failure_rate = tracking_failure_rate
+        self.lock = threading.Lock()
+        self.sessions = {} # session token -> account
+        self.carts = {} # account -> cart items, the bag belongs to the account like on fnet
+        self.orders = {} # fnet order number -> items
+        self.next_order = 48200000
+        self.counts = {}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-fnet', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def delay(self):
+        if self.latency > 0:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def place(self, items):
+        with self.lock:
+            self.next_order += 1
+            self.orders[str(self.next_order)] = items
+            return str(self.next_order)
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.route('GET')
+
+            def do_POST(self):
+                self.route('POST')
+
+            def route(self, method):
+                site.delay()
+                url = urlparse(self.path)
+                self.query = parse_qs(url.query)
+                self.form = {}
+                if method == 'POST':
+                    length = int(self.headers.get('Content-Length') or 0)
+                    self.form = parse_qs(self.rfile.read(length).decode())
+
+                path = url.path.rstrip('/') or '/'
+                site.count(f"{method} {path.split('/')[1] or '/'}")
+                if path == '/login':
+                    return self.login() if method == 'POST' else self.login_page()
+                if path == '/':
+                    return self.page("Home", "<h1>Perfume, cologne and more</h1>")
+                if path == '/search':
+                    return self.search()
+                if path.startswith('/product/'):
+                    return self.product(path.split('/', 2)[2])
+                if path == '/cart/add' and method == 'POST':
+                    return self.add_to_cart()
+                if path == '/cart':
+                    return self.update_cart() if method == 'POST' else self.cart()
+                if path == '/checkout':
+                    return self.checkout()
+                if path.startswith('/pay/'):
+                    return self.payment_frame(path.split('/', 2)[2])
+                if path == '/order' and method == 'POST':
+                    return self.order()
+                if path.startswith('/tracking/'):
+                    return self.tracking(path.split('/', 2)[2])
+                self.send(404, "<h1>Not found</h1>")
+
+            def session(self):
+                cookie = SimpleCookie(self.headers.get('Cookie', ''))
+                token = cookie['session'].value if 'session' in cookie else None
+                return token if token in site.sessions else None
+
+            def page(self, title, body, status=200, headers=None):
+                welcome = '<div class="welcome"><span role="heading">Welcome, bench</span></div>' if self.session() else ''
+                self.send(status, PAGE.format(title=title, welcome=welcome, body=body), headers)
+
+            def send(self, status, text, headers=None):
+                body = text.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def redirect(self, location, headers=None):
+                self.send_response(303)
+                self.send_header('Location', location)
+                self.send_header('Content-Length', '0')
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+
+            def login_page(self):
+                self.page("Sign in", """<form method="post" action="/login">
+  <input name="mv_username" type="text"><input name="mv_password" type="password">
+  <button class="login" type="submit">Sign in</button>
+</form>""")
+
+            def login(self):
+                token = secrets.token_hex(16)
+                account = self.form.get('mv_username', [''])[0]
+                with site.lock:
+                    site.sessions[token] = account
+                    site.carts.setdefault(account, [])
+                self.redirect('/', {'Set-Cookie': f"session={token}; Path=/"})
+
+            def search(self):
+                sku = (self.query.get('mv_searchspec') or [''])[0].strip()
+                if not sku or sku.upper().startswith('UNKNOWN'):
+                    return self.page("Search", f"<h1>No results for {html.escape(sku)}</h1>")
+                self.redirect(f"/product/{sku}")
+
+            def product(self, sku):
+                self.page(f"Product {sku}", f"""<h1 id="brandTitle">Fragrance {html.escape(sku)}</h1>
+<p>SKU {html.escape(sku)}</p>
+<p id="price">${int(sku) % 90 + 10 if sku.isdigit() else 25}.99</p>
+<p class="stock" data-stock="{int(sku) % 40 + 1 if sku.isdigit() else 5}">In stock</p>
+<form method="post" action="/cart/add">
+  <input type="hidden" name="mv_order_item" value="{html.escape(sku)}">
+  <input id="quantBox" name="mv_order_quantity" value="1">
+  <button id="addBagButton" type="submit">Add to bag</button>
+</form>""")
+
+            def add_to_cart(self):
+                token = self.session()
+                if token is None:
+                    return self.redirect('/login')
+                sku = self.form.get('mv_order_item', [''])[0]
+                quantity = int(self.form.get('mv_order_quantity', ['1'])[0] or 1)
+                with site.lock:
+                    site.carts[site.sessions[token]].append((sku, quantity))
+                self.redirect('/cart')
+
+            def cart(self):
+                token = self.session()
+                items = site.carts.get(site.sessions[token], []) if token else []
+                lines = ''.join(
+                    f'<tr><td>{html.escape(sku)}</td><td><input name="quantity{i}" value="{quantity}"></td></tr>'
+                    for i, (sku, quantity) in enumerate(items)
+                )
+                self.page("Cart", f"""<h1>Your bag</h1><form method="post" action="/cart">
+  <table>{lines}</table>
+  <button id="updateCart" type="submit">Update bag</button>
+</form>""")
+
+            # quantity<i> boxes set the new quantity of each line, 0 removes it
+            def update_cart(self):
+                token = self.session()
+                if token is None:
+                    return self.redirect('/login')
+                with site.lock:
+                    items = site.carts[site.sessions[token]]
+                    updated = []
+                    for i, (sku, quantity) in enumerate(items):
+                        value = self.form.get(f"quantity{i}", [str(quantity)])[0]
+                        quantity = int(value) if value.strip().isdigit() else quantity
+                        if quantity > 0:
+                            updated.append((sku, quantity))
+                    site.carts[site.sessions[token]] = updated
+                self.redirect('/cart')
+
+            def checkout(self):
+                if self.session() is None:
+                    return self.redirect('/login')
+                states = ''.join(f'<option value="{s}">{s}</option>' for s in US_STATES)
+                delay_ms = int(site.latency * 1000)
+                self.page("Checkout", CHECKOUT.format(states=states, delay_ms=delay_ms))
+
+            def payment_frame(self, field):
+                field_id = PAYMENT_FIELDS.get(field)
+                if field_id is None:
+                    return self.send(404, "<h1>Not found</h1>")
+                self.send(200, f'<!DOCTYPE html><html><body><input id="{field_id}" type="text"></body></html>')
+
+            def order(self):
+                token = self.session()
+                if token is None:
+                    return self.redirect('/login')
+                if random.random() < site.order_failure_rate:
+                    site.count('order_failures')
+                    return self.page("Error", "<h1>Something went wrong, please try again</h1>", status=500)
+                with site.lock:
+                    account = site.sessions[token]
+                    items, site.carts[account] = site.carts[account], []
+                order_number = site.place(items)
+                self.page("Thank you", f'<h2 class="panel-title">Thank you! Your order #{order_number} has been placed.</h2>')
+
+            def tracking(self, order_number):
+                if random.random() < site.tracking_failure_rate:
+                    site.count('tracking_failures')
+                    return self.send(503, "<h1>Service unavailable</h1>")
+                carrier = CARRIERS[int(order_number) % len(CARRIERS)] if order_number.isdigit() else CARRIERS[0]
+                tracking = f"1Z{order_number.zfill(16)}"
+                self.page(f"Order {order_number}", TRACKING.format(order_number=order_number, carrier=carrier, tracking=tracking))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
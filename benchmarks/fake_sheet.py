@@ -0,0 +1,77 @@
+# in memory stand-in for the gspread worksheet, covering the calls the bot makes
+# (get_all_values, get, batch_get, append_rows, spreadsheet.values_batch_update, title) with a per call latency
+import re
+import time
+import threading
+
+CELL_RANGE_RE = re.compile(r"^(?:'[^']*'!)?([A-Z])(\d+)(?::([A-Z])(\d+)?)?$")
+
+def column_index(letter):
+    return ord(letter) - ord('A')
+
+class FakeSpreadsheet:
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    def values_batch_update(self, body):
+        self.sheet.call('values_batch_update')
+        with self.sheet.lock:
+            for data in body['data']:
+                self.sheet.write_range(data['range'], data['values'])
+        return {'totalUpdatedCells': sum(len(row) for data in body['data'] for row in data['values'])}
+
+class FakeSheet:
+    def __init__(self, rows=None, latency=0.1, title='fnet tracking'):
+        self.title = title
+        self.latency = latency
+        self.rows = [["PO_num", "FNet Order", "Carrier", "Tracking"]] + [list(row) for row in rows or []]
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def call(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def get_all_values(self):
+        self.call('get_all_values')
+        with self.lock:
+            return [list(row) for row in self.rows]
+
+    # "A<row>:D" as the sheet mirror uses it, or a closed range like "B5:B9"
+    def get(self, cell_range):
+        self.call('get')
+        return self.read(cell_range)
+
+    def batch_get(self, ranges):
+        self.call('batch_get')
+        return [self.read(cell_range) for cell_range in ranges]
+
+    def read(self, cell_range):
+        match = CELL_RANGE_RE.match(cell_range)
+        first_col, start_row = column_index(match.group(1)), int(match.group(2))
+        last_col = column_index(match.group(3) or match.group(1))
+        end_row = int(match.group(4)) if match.group(4) else (None if match.group(3) else start_row)
+        with self.lock:
+            return [row[first_col:last_col + 1] for row in self.rows[start_row - 1:end_row]]
+
+    def append_rows(self, values, value_input_option=None, table_range=None):
+        self.call('append_rows')
+        with self.lock:
+            start_row = len(self.rows) + 1
+            self.rows.extend(list(row) for row in values)
+            end_row = len(self.rows)
+        return {'updates': {'updatedRange': f"'{self.title}'!A{start_row}:B{end_row}", 'updatedRows': len(values)}}
+
+    def write_range(self, cell_range, values):
+        match = CELL_RANGE_RE.match(cell_range)
+        first_col, start_row = column_index(match.group(1)), int(match.group(2))
+        for offset, row_values in enumerate(values):
+            row_number = start_row + offset
+            while len(self.rows) < row_number:
+                self.rows.append([])
+            row = self.rows[row_number - 1]
+            row.extend([''] * (first_col + len(row_values) - len(row)))
+            row[first_col:first_col + len(row_values)] = row_values
@@ -0,0 +1,71 @@
+# local stand-in for the smtp server: plain smtp without tls or auth (run the bot with SMTP_STARTTLS=0
+# and no EMAIL_PASSWORD), keeping every message it receives. the first `fail_connections` connections
+# are dropped straight away to exercise the outbox retries
+import threading
+import socketserver
+from email import message_from_bytes
+
+class FakeSmtpServer:
+    def __init__(self, fail_connections=0, host='127.0.0.1', port=0):
+        self.fail_connections = fail_connections
+        self.lock = threading.Lock()
+        self.messages = [] # email.message.Message objects
+        self.connections = 0
+        self.server = socketserver.ThreadingTCPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-smtp', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def subjects(self):
+        with self.lock:
+            return [message['Subject'] for message in self.messages]
+
+    def _handler(self):
+        smtp = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                with smtp.lock:
+                    smtp.connections += 1
+                    if smtp.connections <= smtp.fail_connections:
+                        return self.reply("421 try again later")
+                self.reply("220 fake smtp ready")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors='replace').strip().split(' ', 1)[0].upper()
+                    if command in ('EHLO', 'HELO'):
+                        self.reply("250 fake smtp")
+                    elif command in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                        self.reply("250 ok")
+                    elif command == 'DATA':
+                        self.reply("354 end data with <CR><LF>.<CR><LF>")
+                        lines = []
+                        while True:
+                            data = self.rfile.readline()
+                            if not data or data in (b".\r\n", b".\n"):
+                                break
+                            lines.append(data[1:] if data.startswith(b"..") else data)
+                        with smtp.lock:
+                            smtp.messages.append(message_from_bytes(b"".join(lines)))
+                        self.reply("250 queued")
+                    elif command == 'QUIT':
+                        return self.reply("221 bye")
+                    else:
+                        self.reply("502 not implemented")
+
+        return Handler
@@ -0,0 +1,324 @@
+import os
+import re
+import logging
+from dotenv import load_dotenv
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import Select
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from utils.waits import WaitPolicy, page_settled, iframes_ready
+from utils.sku_cache import sku_cache
+from utils.http_cart import HTTP_CART, HttpCart, record as record_cart
+from utils.step_timing import step_timer
+from utils.retry_policy import PermanentOrderError, CardDeclinedError, CartMismatchError
+
+DECLINE_MARKERS = ("declined", "refused", "card was not accepted")
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# where the site shows a payment failure, only these elements are checked for DECLINE_MARKERS
+PAYMENT_ERROR_SELECTOR = os.getenv('PAYMENT_ERROR_SELECTOR', '.payment-error, .adyen-checkout__error-text, #paymentErrors')
+
+# the bag page, emptied after a failed PO and checked against every PO before checkout
+CART_PAGE_URL = os.getenv('CART_PAGE_URL') # defaults to /cart on the fnet site
+CART_QTY_SELECTOR = os.getenv('CART_QTY_SELECTOR', 'input[name^="quantity"]') # one quantity box per cart line
+
+def extract_order_number(confirmation_text):
+    match = re.search(r"#(\d+)", confirmation_text)
+    if match:
+        return match.group(1)
+    else:
+        return None
+
+# item code from the add to cart form on a product page
+def product_id(driver):
+    inputs = driver.find_elements(By.NAME, "mv_order_item")
+    return inputs[0].get_attribute("value") if inputs else None
+
+# go straight to a cached product page, returns False (and drops the entry) on a miss or mismatch
+def open_cached_product(driver, sku):
+    cached = sku_cache.get(sku)
+    if not cached:
+        return False
+
+    logger.info(f"opening cached product page for sku {sku}")
+    driver.get(cached['url'])
+    try:
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "brandTitle")))
+    except TimeoutException:
+        matches = False
+    else:
+        item = product_id(driver)
+        matches = item == cached['product_id'] if item and cached['product_id'] else sku in driver.page_source
+
+    if not matches:
+        logger.info(f"cached page for sku {sku} no longer matches, falling back to search")
+        sku_cache.invalidate(sku)
+        return False
+    return True
+
+def cart_page_url():
+    from utils.driver_manager import site_home_url
+    return CART_PAGE_URL or f"{site_home_url()}cart"
+
+# open the bag page, returns the quantity box of every cart line
+def open_cart(driver):
+    driver.get(cart_page_url())
+    WebDriverWait(driver, 10).until(lambda d: d.execute_script("return document.readyState;") == 'complete')
+    return driver.find_elements(By.CSS_SELECTOR, CART_QTY_SELECTOR)
+
+# remove every cart line by setting its quantity to 0 and submitting the bag form. the bag belongs to
+# the account, so a failed PO's items are still there after a fresh login until they are removed
+def empty_cart(driver):
+    for attempt in range(3):
+        boxes = open_cart(driver)
+        if not boxes:
+            return
+        if attempt == 2:
+            break
+        logger.info(f"removing {len(boxes)} leftover lines from the cart")
+        for box in boxes:
+            box.clear()
+            box.send_keys('0')
+        boxes[0].submit()
+        WebDriverWait(driver, 10).until(EC.staleness_of(boxes[0]))
+    raise CartMismatchError(f"could not empty the cart, {len(boxes)} lines left")
+
+# the cart must hold exactly the PO's items: one line per sku and the same total quantity.
+# anything else (leftovers from another PO, a lost item) stops the order before checkout
+def verify_cart(driver, order):
+    boxes = open_cart(driver)
+    quantities = [int(box.get_attribute('value') or 0) for box in boxes]
+    page = driver.page_source
+    missing = [item['sku'] for item in order['items'] if item['sku'] not in page]
+    expected = sum(item['quantity'] for item in order['items'])
+    if missing or len(boxes) != len(order['items']) or sum(quantities) != expected:
+        raise CartMismatchError(
+            f"cart has {len(boxes)} lines / {sum(quantities)} items, expected {len(order['items'])} / {expected}"
+            + (f", missing {missing}" if missing else "")
+        )
+
+# place a single PO on a logged in driver, returns the fnet order number (or None).
+# progress(state) is called with 'cart_built' and, just before the order is submitted, 'submitted'.
+# every checkout step is timed as a checkout.<step> span
+def place_order(driver, po_num, order, progress=None):
+    with step_timer.laps('checkout', po_num=po_num) as lap:
+        return checkout_steps(driver, po_num, order, progress, lap)
+
+def checkout_steps(driver, po_num, order, progress, lap):
+    # selenium shortcuts
+    short_wait = WebDriverWait(driver, 10)
+    long_wait = WebDriverWait(driver, 30)
+
+    def short_wait_for_element(by, value, short_wait=short_wait):
+        return short_wait.until(EC.element_to_be_clickable((by, value)))
+
+    def long_wait_for_element(by, value, long_wait=long_wait):
+        return long_wait.until(EC.element_to_be_clickable((by, value)))
+
+    def exit_iframe():
+        driver.switch_to.default_content()
+
+    waits = WaitPolicy(driver)
+
+    logger.info(f"processing PO_num: {po_num}")
+
+    def add_item_in_browser(sku, quantity):
+        lap.next('find_product')
+        if not open_cached_product(driver, sku):
+            logger.info(f"searching for sku {sku}")
+            search_input = long_wait_for_element(By.ID, "searchInput")
+            waits.pause('search_ready', 2)
+            search_input.clear()
+            logger.info('search input cleared')
+            search_input.send_keys(sku)
+            logger.info(f'sku: {sku} searched')
+            search_input.submit()
+            logger.info('search button clicked waiting for item page to load')
+
+            try:
+                long_wait.until(EC.presence_of_element_located((By.ID, "brandTitle")))
+            except TimeoutException:
+                # a fully loaded page without a product title is a search with no match, not a slow site
+                if driver.execute_script("return document.readyState;") == 'complete':
+                    raise PermanentOrderError(f"unknown sku {sku}, search did not open a product page")
+                raise
+            logger.info('found item title')
+            sku_cache.put(sku, driver.current_url, product_id(driver))
+
+        if quantity > 1:
+            logger.info("inputting item quantity")
+            plus_qty = driver.find_element(By.ID, "quantBox")
+            plus_qty.clear()
+            plus_qty.send_keys(quantity)
+
+        logger.info('adding item to cart')
+        lap.next('add_to_cart')
+        add_to_cart_button = short_wait_for_element(By.ID, "addBagButton")
+        add_to_cart_button.click()
+        waits.pause('add_to_cart', 1)
+        logger.info(f"Added {quantity} of {sku} to cart.")
+
+    # build the cart over http when enabled, any item that fails there goes through the browser
+    http_cart = None
+    if HTTP_CART:
+        try:
+            http_cart = HttpCart(driver)
+        except Exception as e:
+            logger.warning(f"http cart unavailable, using browser: {e}")
+
+    # add items to cart loop
+    for item in order["items"]:
+        sku = item["sku"]
+        quantity = item["quantity"]
+
+        if http_cart:
+            lap.next('http_add_to_cart')
+            try:
+                http_cart.add_item(sku, quantity)
+                record_cart('http_items')
+                logger.info(f"Added {quantity} of {sku} to cart over http.")
+                continue
+            except Exception as e:
+                # the request may have failed after the site took the item, adding it again would double it
+                http_cart.sync_to_driver()
+                open_cart(driver)
+                if sku in driver.page_source:
+                    logger.warning(f"http add to cart for sku {sku} failed but the item is in the cart: {e}")
+                    continue
+                record_cart('ui_fallbacks')
+                logger.warning(f"http add to cart failed for sku {sku}, falling back to browser: {e}")
+
+        add_item_in_browser(sku, quantity)
+
+    if http_cart:
+        lap.next('sync_cart')
+        http_cart.sync_to_driver()
+
+    logger.info(f"done attempting to add items for PO_num {po_num}")
+    lap.next('verify_cart')
+    verify_cart(driver, order)
+    if progress:
+        progress('cart_built')
+
+    # checkout process
+    logger.info("navigating to checkout page")
+    lap.next('checkout_page')
+    driver.get(os.getenv('CHECKOUT_PAGE_URL'))
+    shipping_info = order["shipping_info"]
+
+    short_wait_for_element(By.ID, 'shippingFields')
+
+    # fill shipping info
+    logger.info('filling shipping info')
+    lap.next('shipping_info')
+    fields = {
+        'fname': shipping_info["fname"],
+        'lname': shipping_info["lname"],
+        'address1': shipping_info["address1"],
+        'address2': shipping_info["address2"],
+        'zip': shipping_info["zip"],
+        'city': shipping_info["city"]
+    }
+
+    for field_id, value in fields.items():
+        field = short_wait_for_element(By.ID, field_id)
+        field.clear()
+        field.send_keys(value)
+
+    # state dropdown
+    logger.info('filling state')
+    state_field = short_wait_for_element(By.ID, "ship_state_drop")
+    state_select = Select(state_field)
+    try:
+        state_select.select_by_value(shipping_info["state"])
+    except NoSuchElementException:
+        raise PermanentOrderError(f"bad state code {shipping_info['state']}")
+
+    # continue throgh checkout
+    logger.info('clicking continue to shipping button')
+    continue_to_shipping_btn = short_wait_for_element(By.ID, "shippingProceedButton")
+    continue_to_shipping_btn.click()
+
+    # frequent fail point, wait for the shipping options to render
+    lap.next('shipping_options')
+    settled = page_settled()
+    waits.pause('shipping_options', 2, ready=lambda d: d.find_elements(By.ID, "DSP") and settled(d))
+
+    logger.info('selecting dropship shipping option')
+    dropship_shipping_btn = driver.find_element(By.ID, "DSP")
+    driver.execute_script("arguments[0].click();", dropship_shipping_btn)
+
+    logger.info('clicking continue to payment button')
+    continue_to_payment_btn = short_wait_for_element(By.ID, "proceedCheckButton")
+    continue_to_payment_btn.click()
+
+    # payment iframes
+    lap.next('payment_iframes')
+    iframes = WebDriverWait(driver, 30).until(
+        EC.presence_of_all_elements_located((By.CLASS_NAME, "js-iframe"))
+    )
+    # slow site response point, wait until every payment iframe has its input
+    waits.pause('payment_iframes', 2, ready=iframes_ready([
+        (iframes[0], "encryptedCardNumber"),
+        (iframes[1], "encryptedExpiryDate"),
+        (iframes[2], "encryptedSecurityCode"),
+    ]))
+
+    # fill payment info
+    logger.info('filling payment info')
+    lap.next('payment_info')
+    driver.switch_to.frame(iframes[0])
+    card_field = long_wait_for_element(By.ID, "encryptedCardNumber")
+    card_field.clear()
+    card_field.send_keys(os.getenv('CC_NUM'))
+    exit_iframe()
+    waits.pause('card_number', 1)
+
+    driver.switch_to.frame(iframes[1])
+    exp_field = short_wait_for_element(By.ID, "encryptedExpiryDate")
+    exp_field.clear()
+    exp_field.send_keys(os.getenv('CC_EXP_NUM'))
+    exit_iframe()
+    waits.pause('expiry_date', 1)
+
+    driver.switch_to.frame(iframes[2])
+    csv_field = short_wait_for_element(By.ID, "encryptedSecurityCode")
+    csv_field.clear()
+    csv_field.send_keys(os.getenv('CC_CSV'))
+    exit_iframe()
+    waits.pause('security_code', 1)
+
+    # submit order
+    logger.info('submitting order')
+    lap.next('confirmation')
+    submit_order_btn = short_wait_for_element(By.ID, "submitOrder")
+    if progress:
+        progress('submitted')
+    submit_order_btn.click()
+
+    # verify order confirmation
+    logger.info("waiting for confirmation...")
+    try:
+        order_confirmation = WebDriverWait(driver, 30).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "h2.panel-title"))
+        )
+    except TimeoutException:
+        # anything short of a decline in the payment error box may have been placed, the PO stays submitted
+        errors = ' '.join(element.text for element in driver.find_elements(By.CSS_SELECTOR, PAYMENT_ERROR_SELECTOR)).lower()
+        if any(marker in errors for marker in DECLINE_MARKERS):
+            raise CardDeclinedError(f"card declined for PO {po_num}: {errors.strip()}")
+        raise
+    logger.info(f"confirmation found: {order_confirmation.text}")
+    logger.info(f'PO_num {po_num} processed successfully')
+
+    fnet_order_num = extract_order_number(order_confirmation.text)
+    logger.info(f"extracted fnet order number: {fnet_order_num} for PO: {po_num}")
+
+    lap.next('after_order')
+    waits.pause('after_order', 5)
+
+    return fnet_order_num
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import signal
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from utils.ftp_utils import connect_ftp, new_order_files
+from utils.gsheet_setup import setup_google_sheets
+from utils.driver_manager import DriverManager, usable_workers
+from utils.email_utils import outbox
+from utils.log_setup import setup_logging
+from scrape_tracking import create_scraper_pool, scrape_tracking
+from main import place_orders, NUM_WORKERS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# adaptive ftp polling: back to the minimum after finding orders, doubling up to the maximum while idle
+POLL_MIN_SECONDS = float(os.getenv('POLL_MIN_SECONDS', '60'))
+POLL_MAX_SECONDS = float(os.getenv('POLL_MAX_SECONDS', '600'))
+TRACKING_INTERVAL_SECONDS = float(os.getenv('TRACKING_INTERVAL_SECONDS', '3600'))
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '8765')) # 0 disables the health/metrics endpoint
+MAX_RUN_MINUTES = float(os.getenv('MAX_RUN_MINUTES', '180')) # a run going longer than this is reported as hung
+
+# stays resident with a warm browser, sheets client and scraper session pool, polling ftp for orders
+# and running the tracking pass on its own schedule
+class FnetDaemon:
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.poll_interval = POLL_MIN_SECONDS
+        self.failed_runs = 0 # consecutive failed order runs, backs polling off so a broken run isn't retried every minute
+        self.sheet = None
+        self.scraper_pool = None
+        self.managers = [DriverManager(worker_id) for worker_id in range(usable_workers(NUM_WORKERS))]
+        self.metrics = {
+            'started_at': time.time(),
+            'polls': 0,
+            'poll_errors': 0,
+            'order_runs': 0,
+            'orders_successful': 0,
+            'orders_failed': 0,
+            'order_run_errors': 0,
+            'tracking_runs': 0,
+            'tracking_errors': 0,
+            'last_poll_at': 0.0,
+            'last_order_run_at': 0.0,
+            'last_tracking_run_at': 0.0,
+            'run_started_at': 0.0, # order or tracking run in progress, 0 when idle
+            'poll_interval_seconds': self.poll_interval,
+        }
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        server = self.start_health_server()
+        logger.info("fnet daemon started")
+
+        next_poll = 0.0
+        next_tracking = time.time() + TRACKING_INTERVAL_SECONDS
+        try:
+            while not self.stop_event.is_set():
+                now = time.time()
+                if now >= next_poll:
+                    self.poll_orders()
+                    next_poll = time.time() + self.poll_interval
+                if now >= next_tracking and not self.stop_event.is_set():
+                    self.run_tracking()
+                    next_tracking = time.time() + TRACKING_INTERVAL_SECONDS
+                self.stop_event.wait(max(0.0, min(next_poll, next_tracking) - time.time()))
+        finally:
+            logger.info("fnet daemon shutting down")
+            for manager in self.managers:
+                manager.close()
+            outbox.close() # sends any pending failed orders digest
+            if server:
+                server.shutdown()
+
+    def stop(self, signum=None, frame=None):
+        logger.info(f"received signal {signum}, finishing current work before exiting")
+        self.stop_event.set()
+
+    def clients(self):
+        if self.sheet is None:
+            self.sheet = setup_google_sheets()
+        if self.scraper_pool is None:
+            self.scraper_pool = create_scraper_pool()
+        return self.sheet, self.scraper_pool
+
+    def has_new_orders(self):
+        orders_dir = os.getenv('LOCAL_ORDERS_DIR')
+        if any(f.endswith('.csv') for f in os.listdir(orders_dir)):
+            return True # unfinished local files from an earlier run
+        ftp = connect_ftp()
+        if ftp is None:
+            raise ConnectionError("could not connect to ftp")
+        try:
+            return bool(new_order_files(ftp))
+        finally:
+            ftp.quit()
+
+    def poll_orders(self):
+        self.metrics['polls'] += 1
+        self.metrics['last_poll_at'] = time.time()
+        try:
+            found = self.has_new_orders()
+        except Exception as e:
+            self.metrics['poll_errors'] += 1
+            logger.error(f"ftp poll failed: {e}")
+            found = False
+
+        if found:
+            self.failed_runs = 0 if self.run_orders() else self.failed_runs + 1
+            self.poll_interval = min(POLL_MIN_SECONDS * 2 ** self.failed_runs, POLL_MAX_SECONDS)
+        else:
+            self.poll_interval = min(self.poll_interval * 2, POLL_MAX_SECONDS)
+        self.metrics['poll_interval_seconds'] = self.poll_interval
+
+    def run_orders(self):
+        self.metrics['order_runs'] += 1
+        self.metrics['last_order_run_at'] = time.time()
+        self.metrics['run_started_at'] = time.time()
+        try:
+            sheet, _ = self.clients()
+            successful, failed = place_orders(sheet=sheet, managers=self.managers)
+            self.metrics['orders_successful'] += successful
+            self.metrics['orders_failed'] += failed
+            return True
+        except Exception as e:
+            self.metrics['order_run_errors'] += 1
+            logger.error(f"order run failed: {e}", exc_info=True)
+            return False
+        finally:
+            self.metrics['run_started_at'] = 0.0
+
+    def run_tracking(self):
+        self.metrics['tracking_runs'] += 1
+        self.metrics['last_tracking_run_at'] = time.time()
+        self.metrics['run_started_at'] = time.time()
+        try:
+            sheet, pool = self.clients()
+            scrape_tracking(sheet=sheet, pool=pool)
+        except Exception as e:
+            self.metrics['tracking_errors'] += 1
+            logger.error(f"tracking run failed: {e}", exc_info=True)
+        finally:
+            self.metrics['run_started_at'] = 0.0
+
+    def health(self):
+        now = time.time()
+        # healthy as long as polling hasn't stalled. polls wait while an order or tracking run
+        # is going on the same thread, so a run counts as working until MAX_RUN_MINUTES
+        started = self.metrics['run_started_at']
+        if started > 0:
+            healthy = now - started < MAX_RUN_MINUTES * 60
+        else:
+            healthy = now - self.metrics['last_poll_at'] < POLL_MAX_SECONDS * 2 + 300
+        return dict(
+            self.metrics, healthy=healthy, uptime_seconds=round(now - self.metrics['started_at']),
+            emails_sent=outbox.stats['sent'], emails_unsent=outbox.stats['unsent'],
+        )
+
+    def prometheus_metrics(self):
+        lines = []
+        for key, value in self.health().items():
+            if isinstance(value, bool):
+                value = int(value)
+            lines.append(f"# TYPE fnetbot_daemon_{key} gauge")
+            lines.append(f"fnetbot_daemon_{key} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def start_health_server(self):
+        if not HEALTH_PORT:
+            return None
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/health':
+                    health = daemon.health()
+                    body = json.dumps(health).encode()
+                    self.send_response(200 if health['healthy'] else 503)
+                    self.send_header('Content-Type', 'application/json')
+                elif self.path == '/metrics':
+                    body = daemon.prometheus_metrics().encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                else:
+                    body = b'not found'
+                    self.send_response(404)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', HEALTH_PORT), Handler)
+        threading.Thread(target=server.serve_forever, name='health-server', daemon=True).start()
+        logger.info(f"health and metrics on http://127.0.0.1:{HEALTH_PORT}/health and /metrics")
+        return server
+
+if __name__ == '__main__':
+    setup_logging()
+    FnetDaemon().run()
@@ -0,0 +1,215 @@
+import os
+import re
+import csv
+import time
+import sqlite3
+import logging
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils.rate_limit import TokenBucket
+from utils.step_timing import step_timer
+from utils.log_setup import setup_logging
+from utils.ftp_utils import connect_ftp, upload_files
+from utils.sku_preflight import preflight_session, search_form, fetch_product_page, UNKNOWN, AVAILABLE
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+INVENTORY_DB = os.path.join(STATE_DIR, 'inventory.db')
+INVENTORY_SKUS_FILE = os.getenv('INVENTORY_SKUS_FILE', 'inventory_skus.csv') # our sku universe, a csv with a SKU column
+INVENTORY_FULL_EVERY_HOURS = float(os.getenv('INVENTORY_FULL_EVERY_HOURS', '24')) # full feed instead of a delta
+INVENTORY_IN_STOCK_QTY = int(os.getenv('INVENTORY_IN_STOCK_QTY', '0')) # listed qty when a page shows stock but no count, 0 skips the sku
+INVENTORY_WORKERS = int(os.getenv('INVENTORY_WORKERS', '8'))
+INVENTORY_REQUESTS_PER_SECOND = float(os.getenv('INVENTORY_REQUESTS_PER_SECOND', '5'))
+CHUNK_SIZE = 200 # skus in flight at once, memory stays flat however big the catalogue is
+
+FEED_COLUMNS = ["SKU", "Qty", "Price"]
+PRICE_RES = [
+    re.compile(r"itemprop=[\"']price[\"'][^>]*content=[\"']\$?([\d.,]+)", re.I),
+    re.compile(r"data-price=[\"']\$?([\d.,]+)", re.I),
+    re.compile(r"id=[\"']price[\"'][^>]*>\s*\$?([\d.,]+)", re.I),
+]
+STOCK_RES = [
+    re.compile(r"data-stock=[\"'](\d+)", re.I),
+    re.compile(r"only (\d+) left", re.I),
+]
+
+# (qty, price) from a product page. qty is 0 when the sku is unavailable. qty and price are None when
+# they can't be read from the page, nothing made up gets published
+def stock_and_price(page, status):
+    price = None
+    for price_re in PRICE_RES:
+        match = price_re.search(page)
+        if match:
+            price = match.group(1).replace(',', '')
+            break
+    if status != AVAILABLE:
+        return 0, price
+    for stock_re in STOCK_RES:
+        match = stock_re.search(page)
+        if match:
+            return int(match.group(1)), price
+    return INVENTORY_IN_STOCK_QTY or None, price
+
+# last sent qty / price per sku. every run gets a number, skus not seen in a run have left the universe
+class InventorySnapshot:
+    def __init__(self, path=INVENTORY_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "sku TEXT PRIMARY KEY, qty INTEGER NOT NULL, price TEXT NOT NULL, seen_run INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def _meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def next_run(self):
+        return int(self._meta('last_run', '0')) + 1
+
+    def full_due(self):
+        return time.time() - float(self._meta('last_full_at', '0')) >= INVENTORY_FULL_EVERY_HOURS * 3600
+
+    # (qty, price, seen_run) or None
+    def get(self, sku):
+        return self.conn.execute("SELECT qty, price, seen_run FROM items WHERE sku = ?", (sku,)).fetchone()
+
+    def put(self, sku, qty, price, run):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO items (sku, qty, price, seen_run, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (sku, qty, price, run, time.time()),
+        )
+
+    def mark_seen(self, sku, run):
+        self.conn.execute("UPDATE items SET seen_run = ? WHERE sku = ?", (run, sku))
+
+    # skus that dropped out of the universe and still have stock listed
+    def delisted(self, run):
+        return self.conn.execute("SELECT sku, price FROM items WHERE seen_run < ? AND qty > 0 ORDER BY sku", (run,))
+
+    def zero_delisted(self, run):
+        self.conn.execute("UPDATE items SET qty = 0, updated_at = ? WHERE seen_run < ? AND qty > 0", (time.time(), run))
+
+    # nothing is committed until the feed has been uploaded, a failed upload leaves the old snapshot
+    def commit(self, run, full):
+        self._set_meta('last_run', run)
+        if full:
+            self._set_meta('last_full_at', time.time())
+        self.conn.commit()
+
+    def close(self):
+        self.conn.rollback()
+        self.conn.close()
+
+# stream skus from the universe file without loading it
+def iter_skus(path):
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            sku = (row.get('SKU') or '').strip()
+            if sku:
+                yield sku
+
+# fetch every sku's stock and price concurrently, write the changed rows (or every row for a full feed)
+# to a csv as it goes, upload it to the ftp inventory dir and only then save the new snapshot
+def update_inventory_feed(full=None, skus_file=INVENTORY_SKUS_FILE):
+    from utils.driver_manager import site_home_url
+
+    step_timer.start_run('inventory')
+    snapshot = InventorySnapshot()
+    counts = {'skus': 0, 'rows': 0, 'unknown': 0, 'unreadable': 0, 'out_of_stock': 0, 'delisted': 0}
+    try:
+        run = snapshot.next_run()
+        full = snapshot.full_due() if full is None else full
+        kind = 'full' if full else 'delta'
+
+        session = preflight_session()
+        search = search_form(session, site_home_url())
+        if search is None:
+            raise RuntimeError("could not find the site search form")
+        rate_limiter = TokenBucket(INVENTORY_REQUESTS_PER_SECOND, capacity=max(1, INVENTORY_WORKERS))
+
+        def fetch(sku):
+            response, status, _ = fetch_product_page(session, search, rate_limiter, sku)
+            if status == UNKNOWN:
+                return None
+            return stock_and_price(response.text, status)
+
+        feed_name = f"inventory_{kind}_{time.strftime('%Y%m%d-%H%M%S')}.csv"
+        feed_path = os.path.join(STATE_DIR, feed_name)
+        logger.info(f"building {kind} inventory feed from {skus_file}")
+        with open(feed_path, 'w', newline='') as f, ThreadPoolExecutor(max_workers=max(1, INVENTORY_WORKERS)) as executor:
+            writer = csv.writer(f)
+            writer.writerow(FEED_COLUMNS)
+            skus = iter_skus(skus_file)
+            while True:
+                chunk = list(islice(skus, CHUNK_SIZE))
+                if not chunk:
+                    break
+                for sku, result in zip(chunk, executor.map(fetch, chunk)):
+                    previous = snapshot.get(sku)
+                    if previous and previous[2] == run:
+                        continue # listed twice in the universe
+                    counts['skus'] += 1
+                    qty, price = result or (None, None)
+                    if qty == 0 and price is None and previous:
+                        price = previous[1] # out of stock pages often leave the price off
+                    if qty is None or price is None:
+                        # couldn't check it or read it, keep what was last sent
+                        if result is None:
+                            counts['unknown'] += 1
+                        else:
+                            counts['unreadable'] += 1
+                            missing = 'price' if price is None else 'stock count'
+                            logger.warning(f"no {missing} on the product page for sku {sku}, keeping the last sent row")
+                        if previous:
+                            snapshot.mark_seen(sku, run)
+                            if full:
+                                writer.writerow([sku, previous[0], previous[1]])
+                                counts['rows'] += 1
+                        continue
+                    if qty == 0:
+                        counts['out_of_stock'] += 1
+                    snapshot.put(sku, qty, price, run)
+                    if full or previous is None or (previous[0], previous[1]) != (qty, price):
+                        writer.writerow([sku, qty, price])
+                        counts['rows'] += 1
+                logger.info(f"checked {counts['skus']} skus, {counts['rows']} feed rows so far")
+
+            # skus dropped from the universe go out once with no stock
+            for sku, price in snapshot.delisted(run):
+                writer.writerow([sku, 0, price])
+                counts['delisted'] += 1
+                counts['rows'] += 1
+            snapshot.zero_delisted(run)
+
+        if counts['rows']:
+            ftp = connect_ftp()
+            if ftp is None:
+                raise ConnectionError("could not connect to ftp to upload the inventory feed")
+            try:
+                upload_files(ftp, feed_path, feed_name)
+            finally:
+                ftp.quit()
+            logger.info(f"uploaded {feed_name} with {counts['rows']} rows")
+        else:
+            logger.info("no inventory changes to upload")
+        snapshot.commit(run, full)
+        os.remove(feed_path)
+        return counts
+    finally:
+        snapshot.close()
+        timing = step_timer.report()
+        logger.info(f"inventory feed: {counts}, took {timing['run_seconds']} s")
+
+if __name__ == '__main__':
+    setup_logging()
+    update_inventory_feed()
@@ -1,40 +1,121 @@
+from utils.startup_timing import startup
 import os
-import csv
-import time
+import math
 import shutil
+import logging
+import argparse
 from dotenv import load_dotenv
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import Select
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException
 from utils.ftp_utils import connect_ftp, download_files, archive_files_on_ftp
-from utils.selenium_setup import get_driver
-from login import fnet_login
-from scrape_tracking import scrape_tracking
-from utils.email_utils import send_email
+from utils.email_utils import outbox
+from utils.log_setup import setup_logging
 from utils.gsheet_setup import setup_google_sheets, batch_gsheet
-import re
+from utils.rate_limit import TokenBucket
+from utils.worker_pool import run_workers
+from utils.order_ingest import build_work_queue
+from utils.sheet_mirror import SheetMirror
+from utils.order_journal import OrderJournal, QUEUED, SUBMITTED, CONFIRMED, FAILED, RECORDED
+from utils.sku_cache import sku_cache
+from utils.step_timing import step_timer, slowest_steps
+from utils.retry_policy import RetryScheduler, classify_failure, TRANSIENT, CardDeclinedError
+
+# selenium, undetected_chromedriver, gspread and cloudscraper are only imported once there is work to do
 
 load_dotenv()
+startup.mark('imports')
+
+logger = logging.getLogger(__name__)
+
+# worker pool settings
+NUM_WORKERS = int(os.getenv('NUM_WORKERS', '1')) # concurrent checkout browsers
+ORDERS_PER_MINUTE = float(os.getenv('ORDERS_PER_MINUTE', '0')) # site rate limit across all workers, 0 = no limit
+LEGACY_BATCH_SIZE = 15 # old launch + login cadence, used to report sessions avoided
+
+# checkout every (file, po_num, order) job over a pool of browser workers, one driver manager per worker.
+# transient failures from before the order was submitted are retried on a fresh session by the scheduler.
+# every PO state change is written to the order journal.
+# returns a list of (file, po_num, fnet_order_num, error, attempts) outcomes
+def process_orders(jobs, managers, journal, scheduler):
+    from checkout import place_order
+
+    outcomes = []
+    finished = set() # POs with an outcome
+    rate_limiter = TokenBucket(ORDERS_PER_MINUTE / 60)
+
+    def finish(file, po_num, fnet_order_num, error, attempt):
+        outcomes.append((file, po_num, fnet_order_num, error, attempt))
+        finished.add(po_num)
+
+    def run_job(manager, job):
+        file, po_num, order = job
+        attempt = scheduler.attempt(po_num)
+
+        try:
+            driver = manager.get()
+            if driver is None:
+                raise ConnectionError('login failed')
+            rate_limiter.acquire()
+            progress = lambda state, po_num=po_num, file=file: journal.record(po_num, state, file=file)
+            fnet_order_num = place_order(driver, po_num, order, progress=progress)
+        except Exception as e:
+            # once submitted the order may have gone through, so it is never placed again
+            submitted = journal.state(po_num) == SUBMITTED and not isinstance(e, CardDeclinedError)
+            kind = classify_failure(e)
+            logger.error(f"error processing order {po_num} from {file} (attempt {attempt}, {kind}): {e}")
+            # any failure can leave items in the cart, the next PO must never check out with them
+            manager.reset_session(reason=f"{type(e).__name__} on PO {po_num}")
+            if not submitted:
+                journal.record(po_num, FAILED, file=file, error=str(e))
+            if scheduler.failed(job, retryable=kind == TRANSIENT and not submitted):
+                journal.record(po_num, QUEUED, file=file)
+            else:
+                finish(file, po_num, None, str(e), attempt)
+            # only browser and site errors say anything about chrome's health, bad order data doesn't
+            manager.order_done(failed=kind == TRANSIENT)
+            return
 
-def extract_order_number(confirmation_text):
-    match = re.search(r"#(\d+)", confirmation_text)
-    if match:
-        return match.group(1)
-    else:
-        return None
-    
-def place_orders():
+        # the outcome goes first, so the order still reaches the sheet if the journal write fails
+        finish(file, po_num, fnet_order_num, None, attempt)
+        scheduler.succeeded(job)
+        journal.record(po_num, CONFIRMED, file=file, fnet_order_num=fnet_order_num)
+        manager.order_done()
+
+    def worker(worker_id, job_queue):
+        manager = managers[worker_id]
+        while True:
+            job = scheduler.next_job(job_queue)
+            if job is None:
+                return
+            file, po_num, _ = job
+            try:
+                run_job(manager, job)
+            except Exception as e:
+                # journal or browser bookkeeping failed around the order, the PO still needs an outcome
+                logger.error(f"worker {worker_id} failed handling PO {po_num}: {e}", exc_info=True)
+                if po_num not in finished and not scheduler.waiting(job):
+                    finish(file, po_num, None, f"worker error: {e}", scheduler.attempt(po_num))
+            finally:
+                # always released, or the other workers wait on it forever
+                scheduler.release(job)
+
+    leftover = run_workers(jobs, worker, len(managers)) + scheduler.leftover()
+    for file, po_num, _ in leftover:
+        outcomes.append((file, po_num, None, 'order worker crashed', scheduler.attempt(po_num)))
+    return outcomes
+
+# one order run. a long running caller (daemon.py) can pass its warm sheet client and driver managers,
+# which are then left open. returns the number of (successful, failed) orders
+def place_orders(sheet=None, managers=None):
+    step_timer.start_run('orders')
     try:
-        #setup sheets
-        sheet = setup_google_sheets()
         orders_to_update = []
 
         # track success/failure
         successful_orders = []
         failed_orders = []
 
+        # per PO journal, lets a run that died part way resume without placing anything twice
+        journal = OrderJournal()
+
         # archive directory setup
         archive_dir = os.path.join(os.getenv('LOCAL_ORDERS_DIR'), 'processed')
         os.makedirs(archive_dir, exist_ok=True)
@@ -46,259 +127,208 @@ def place_orders():
             try:
                 downloaded_files = download_files(ftp)
                 if downloaded_files:
-                    print(f"downloaded files: {downloaded_files}")
+                    logger.info(f"downloaded files: {downloaded_files}")
                     archive_files_on_ftp(ftp, downloaded_files)
                 else:
-                    print("no files downloaded")
+                    logger.info("no files downloaded")
             finally:
                 ftp.quit()
-                print("FTP connection closed")  
+                logger.info("FTP connection closed")  
         else:
-            print('could not connect to ftp')
-            return
+            logger.error('could not connect to ftp')
+            journal.close()
+            return 0, 0
         
-        if not downloaded_files:
-            print('no files to download. exiting')
-            return
-
-        # process each file loop
-        for file in downloaded_files:
-            try:
-                file_path = os.path.join(os.getenv('LOCAL_ORDERS_DIR'), file)
-                with open(file_path, 'r') as f:
-                    reader = csv.DictReader(f)
-                    orders_data = list(reader)
-
-                # group orders by PO
-                grouped_orders = {}
-                for row in orders_data:
-                    po_num = row["PO_num"]
-                    if po_num not in grouped_orders:
-                        grouped_orders[po_num] = {
-                            "shipping_info": {
-                                "fname": row["First Name"],
-                                "lname": row["Last Name"],
-                                "address1": row["Ship To Address"],
-                                "address2": row.get("Ship To Address 2", ""),
-                                "city": row["Ship To City"],
-                                "state": row["Ship To State"],
-                                "zip": row["Ship To Zip"],
-                            },
-                            "items": []
-                        }
-                    grouped_orders[po_num]["items"].append({
-                        "sku": row["SKU"],
-                        "quantity": int(row["Qty"])
-                    })
-
-                batch_size = 15
-                orders = list(grouped_orders.items())
-                po_nums = [po for po, details in orders]
-                print(f'batched orders: {po_nums}')
-
-                for i in range(0, len(orders), batch_size):
-                    driver = get_driver()
-                    
-                    username = os.getenv("LOGIN_USERNAME")
-                    password = os.getenv("LOGIN_PASSWORD")
-                    login_success = fnet_login(driver, username, password)
-                    if not login_success:
-                        driver.quit()
-                        continue
-
-                    # selenium shortcuts
-                    short_wait = WebDriverWait(driver, 10)
-                    long_wait = WebDriverWait(driver, 30)
-
-                    def short_wait_for_element(by, value, short_wait=short_wait):
-                        return short_wait.until(EC.element_to_be_clickable((by, value)))
-                    
-                    def long_wait_for_element(by, value, long_wait=long_wait):
-                        return long_wait.until(EC.element_to_be_clickable((by, value)))
-                    
-                    def exit_iframe():
-                        driver.switch_to.default_content()
-
-                    # process each order loop
-                    for po_num, order in orders[i:i+batch_size]:
-                        try:
-                            print(f"processing PO_num: {po_num}")
-
-                            # add items to cart loop
-                            for item in order["items"]:
-                                sku = item["sku"]
-                                quantity = item["quantity"]
-
-                                print(f"searching for sku {sku}")
-                                search_input = long_wait_for_element(By.ID, "searchInput")
-                                time.sleep(2)
-                                search_input.clear()
-                                print('search input cleared')
-                                search_input.send_keys(sku)
-                                print(f'sku: {sku} searched')
-                                search_input.submit()
-                                print('search button clicked waiting for item page to load')
-
-                                long_wait.until(EC.presence_of_element_located((By.ID, "brandTitle")))
-                                print('found item title')
-
-                                if quantity > 1:
-                                    print("inputting item quantity")
-                                    plus_qty = driver.find_element(By.ID, "quantBox")
-                                    plus_qty.clear()
-                                    plus_qty.send_keys(quantity)
-
-                                print('adding item to cart')
-                                add_to_cart_button = short_wait_for_element(By.ID, "addBagButton")
-                                add_to_cart_button.click()
-                                time.sleep(1)
-                                print(f"Added {quantity} of {sku} to cart.")
-
-                            print(f"done attempting to add items for PO_num {po_num}")
-                            
-                            # checkout process
-                            print("navigating to checkout page")
-                            driver.get(os.getenv('CHECKOUT_PAGE_URL'))
-                            shipping_info = order["shipping_info"]
-
-                            short_wait_for_element(By.ID, 'shippingFields')
-
-                            # fill shipping info
-                            print('filling shipping info')
-                            fields = {
-                                'fname': shipping_info["fname"],
-                                'lname': shipping_info["lname"],
-                                'address1': shipping_info["address1"],
-                                'address2': shipping_info["address2"],
-                                'zip': shipping_info["zip"],
-                                'city': shipping_info["city"]
-                            }
-                            
-                            for field_id, value in fields.items():
-                                field = short_wait_for_element(By.ID, field_id)
-                                field.clear()
-                                field.send_keys(value)
-
-                            # state dropdown
-                            print('filling state')
-                            state_field = short_wait_for_element(By.ID, "ship_state_drop")
-                            state_select = Select(state_field)
-                            state_select.select_by_value(shipping_info["state"])
-
-                            # continue throgh checkout
-                            print('clicking continue to shipping button')
-                            continue_to_shipping_btn = short_wait_for_element(By.ID, "shippingProceedButton")
-                            continue_to_shipping_btn.click()
-
-                            time.sleep(2) # frequent fail point, adding wait
-
-                            print('selecting dropship shipping option')
-                            dropship_shipping_btn = driver.find_element(By.ID, "DSP")
-                            driver.execute_script("arguments[0].click();", dropship_shipping_btn)
-
-                            print('clicking continue to payment button')
-                            continue_to_payment_btn = short_wait_for_element(By.ID, "proceedCheckButton")
-                            continue_to_payment_btn.click()
-
-                            # payment iframes
-                            iframes = WebDriverWait(driver, 30).until(
-                                EC.presence_of_all_elements_located((By.CLASS_NAME, "js-iframe"))
-                            )
-                            time.sleep(2) #adding wait for slow site response point
-
-                            # fill payment info
-                            print('filling payment info')
-                            driver.switch_to.frame(iframes[0])
-                            card_field = long_wait_for_element(By.ID, "encryptedCardNumber")
-                            card_field.clear()
-                            card_field.send_keys(os.getenv('CC_NUM'))
-                            exit_iframe()
-                            time.sleep(1)
-
-                            driver.switch_to.frame(iframes[1])
-                            exp_field = short_wait_for_element(By.ID, "encryptedExpiryDate")
-                            exp_field.clear()
-                            exp_field.send_keys(os.getenv('CC_EXP_NUM'))
-                            exit_iframe()
-                            time.sleep(1)
-
-                            driver.switch_to.frame(iframes[2])
-                            csv_field = short_wait_for_element(By.ID, "encryptedSecurityCode")
-                            csv_field.clear()
-                            csv_field.send_keys(os.getenv('CC_CSV'))
-                            exit_iframe()
-                            time.sleep(1)
-
-                            # submit order
-                            print('submitting order')
-                            submit_order_btn = short_wait_for_element(By.ID, "submitOrder")
-                            submit_order_btn.click()
-                            
-                            # verify order confirmation
-                            print("waiting for confirmation...")
-                            order_confirmation = WebDriverWait(driver, 30).until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, "h2.panel-title"))
-                            )
-                            print(f"confirmation found: {order_confirmation.text}")
-                            print(f'PO_num {po_num} processed successfully')
-                            
-                            # add the order number to a google sheet for shipment tracking
-                            fnet_order_num = extract_order_number(order_confirmation.text)
-                            print(f"extracted fnet order number: {fnet_order_num} for PO: {po_num}")
-                            if fnet_order_num:
-                                orders_to_update.append((po_num, fnet_order_num)) #add order info to batch
-                                print('added fnet order number and PO number to gsheet batch')
-                            else:
-                                print('fnet order number not found')
-                            
-                            # append file & po_num to success tracking
-                            successful_orders.append((file, po_num))
-
-                            time.sleep(5)
-
-                        except Exception as e:
-                            failed_orders.append((file, po_num, str(e)))
-                            print(f"error processing order {po_num} from {file}: {e}")
-
-                    driver.quit() #reset the driver session to avoid resource limitations
-                    print('driver session closed for batch', i)
+        # files a crashed run downloaded (and already archived on ftp) but never finished
+        orders_dir = os.getenv('LOCAL_ORDERS_DIR')
+        leftover_files = sorted(f for f in os.listdir(orders_dir) if f.endswith('.csv') and f not in downloaded_files)
+        if leftover_files:
+            logger.info(f"resuming unfinished files from a previous run: {leftover_files}")
+        order_files = leftover_files + downloaded_files
+
+        # confirmed orders from a crashed run that never made it into the sheet
+        recovered_orders = journal.unrecorded()
+        orders_to_update.extend(recovered_orders)
+
+        if not order_files and not recovered_orders:
+            logger.info('no files to download. exiting')
+            startup.mark('no_work')
+            journal.close()
+            return 0, 0
+        startup.mark('work_found')
+
+        # heavy imports and client setup only now that there is work
+        from utils.driver_manager import DriverManager, session_report, site_home_url, usable_workers
+        from utils import sku_preflight
+        from utils.waits import latency_model
+        from utils import http_cart
+        startup.mark('heavy_imports')
 
-            except Exception as e:
-                print(f"error processing file {file}: {e}")
+        #setup sheets
+        sheet = sheet or setup_google_sheets()
+        startup.mark('sheets_ready')
+
+        # warm browser sessions, reused across batches and files
+        own_managers = managers is None
+        if own_managers:
+            managers = [DriverManager(worker_id) for worker_id in range(usable_workers(NUM_WORKERS))]
+        # a resident caller (daemon.py) reuses all of these, the summary covers this run only
+        for manager in managers:
+            manager.reset_stats()
+        sku_cache.reset_stats()
+        sku_preflight.reset_stats()
+        http_cart.reset_stats()
+
+        # one work queue for the whole run: every file streamed, validated and merged by PO
+        mirror = SheetMirror()
+
+        def skip_reason(po_num):
+            if journal.state(po_num) == SUBMITTED:
+                return "submitted before a crash but never confirmed, check FNet manually"
+            if journal.already_placed(po_num) or mirror.row_for_po(po_num):
+                return "already placed in an earlier run"
+            return None
+
+        try:
+            mirror.sync(sheet)
+            jobs, rejected, skipped, pos_per_file = build_work_queue(orders_dir, order_files, skip_reason=skip_reason)
+        finally:
+            mirror.close()
+        failed_orders.extend(rejected)
+        # a PO submitted before a crash needs a manual check, anything else was simply placed already
+        skipped_orders = []
+        for file, po_num, reason in skipped:
+            (failed_orders if journal.state(po_num) == SUBMITTED else skipped_orders).append((file, po_num, reason))
+
+        # check every sku over http before any browser starts, POs that can't be fulfilled fail fast
+        availability = sku_preflight.preflight_skus({item['sku'] for _, _, order in jobs for item in order['items']}, site_home_url())
+        ready_jobs = []
+        for file, po_num, order in jobs:
+            reason = sku_preflight.unavailable_reason(order, availability)
+            if reason:
+                logger.warning(f"PO {po_num} from {file} failed pre-flight: {reason}")
+                journal.record(po_num, FAILED, file=file, error=reason)
+                failed_orders.append((file, po_num, reason))
+            else:
+                ready_jobs.append((file, po_num, order))
+        jobs = ready_jobs
+
+        for file, po_num, _ in jobs:
+            journal.record(po_num, QUEUED, file=file)
+        baseline_sessions = sum(math.ceil(count / LEGACY_BATCH_SIZE) for count in pos_per_file.values())
+        logger.info(f'batched orders: {[po_num for _, po_num, _ in jobs]}')
+
+        scheduler = RetryScheduler()
+        outcomes = process_orders(jobs, managers, journal, scheduler) if jobs else []
+
+        # merge worker results back into the run totals
+        attempts = {}
+        for file, po_num, fnet_order_num, error, attempt in outcomes:
+            attempts[po_num] = attempt
+            if error:
+                failed_orders.append((file, po_num, error))
+                continue
+            # add the order number to a google sheet for shipment tracking
+            if fnet_order_num:
+                orders_to_update.append((po_num, fnet_order_num)) #add order info to batch
+                logger.info('added fnet order number and PO number to gsheet batch')
+            else:
+                logger.warning('fnet order number not found')
+            # append file & po_num to success tracking
+            successful_orders.append((file, po_num))
+
+        if own_managers:
+            for manager in managers:
+                manager.close()
+        latency_model.save() # keep learned step timings for the next run
+        sku_cache.close()
+        sessions = session_report(managers, baseline_sessions, orders=len(jobs))
+        logger.info(f"browser sessions: {sessions}")
 
         if orders_to_update:
             batch_gsheet(sheet, orders_to_update)
-            print('successfully added all batched orders to google sheet')
+            logger.info('successfully added all batched orders to google sheet')
+            for po_num, _ in orders_to_update:
+                journal.record(po_num, RECORDED)
+        journal.compact()
+        journal.close()
 
         # archive the order files
-        for file in downloaded_files:
+        for file in order_files:
             src = os.path.join(os.getenv('LOCAL_ORDERS_DIR'), file)
             dst = os.path.join(archive_dir, file)
             try:
                 shutil.move(src, dst)
-                print(f"moved {file} to archive")
+                logger.info(f"moved {file} to archive")
             except Exception as e:
-                print(f"failed to move {file}: {str(e)}")
+                logger.error(f"failed to move {file}: {str(e)}")
 
-        # send summary email
-        print('sending summary email')
+        # per step timings to STATE_DIR/step_timings and the prometheus textfile
+        timing = step_timer.report(orders=len(successful_orders))
+        logger.info(f"step timings: {timing['steps']}")
+
+        # queue the summary email, each failed PO goes into the failed orders digest
+        logger.info('sending summary email')
         subject = "FNET Order Summary"
-        successful_msg = ', '.join(f'{po_num} ({f})' for f, po_num in successful_orders) if successful_orders else "None"
-        failed_msg = ', '.join(f'{po_num} ({f})' for f, po_num, _ in failed_orders) if failed_orders else "None"
+        tries = lambda po_num: f", {attempts[po_num]} attempts" if attempts.get(po_num, 1) > 1 else ""
+        successful_msg = ', '.join(f'{po_num} ({f}{tries(po_num)})' for f, po_num in successful_orders) if successful_orders else "None"
+        failed_msg = ', '.join(str(po_num) for _, po_num, _ in failed_orders) + " (reasons in the failed orders digest)" if failed_orders else "None"
+        skipped_msg = ', '.join(f'{po_num} ({f})' for f, po_num, _ in skipped_orders) if skipped_orders else "None"
+        for f, po_num, reason in failed_orders:
+            outbox.failure(po_num, reason, file=f, attempts=attempts.get(po_num, 1))
 
         body = f"""
         Successful orders: {len(successful_orders)}
         {successful_msg}
 
         Failed orders: {len(failed_orders)}
-        {failed_msg}"""
+        {failed_msg}
+
+        Skipped (already placed in an earlier run or delivered again): {len(skipped_orders)}
+        {skipped_msg}
 
-        send_email(subject, body)
+        Retries: {scheduler.stats['retries']} transient failures retried, {scheduler.stats['recovered']} recovered, {scheduler.stats['budget_exhausted']} not retried (retry budget used up)
+
+        Browser launches: {sessions['launches']} ({sessions['launches_avoided']} avoided)
+        Logins: {sessions['logins']} ({sessions['logins_avoided']} avoided, {sessions['cookie_restores']} restored from cookies, {sessions['session_resets']} session resets after failed orders)
+        Chrome recycles: {sessions['recycles']} ({', '.join(f'{count} {kind}' for kind, count in sessions['recycle_reasons'].items()) or 'none'})
+        Browser traffic: {sessions['bytes'] / 1048576:.1f} MB ({sessions['kb_per_order']} KB/order), {sessions['blocked_requests']} requests blocked, average page load {sessions['avg_page_load_seconds']} s
+        SKU pre-flight: {sku_preflight.stats['checked']} checked, {sku_preflight.stats['cached']} from cache, {sku_preflight.stats['unavailable']} unavailable, {sku_preflight.stats['unknown']} inconclusive
+        SKU cache: {sku_cache.stats['hits']} hits, {sku_cache.stats['misses']} misses, {sku_cache.stats['invalidations']} invalidated
+        HTTP cart: {http_cart.stats['http_items']} items added over http, {http_cart.stats['ui_fallbacks']} browser fallbacks
+        Recovered from journal: {len(recovered_orders)} confirmed orders added to the sheet, {len(leftover_files)} unfinished files resumed
+        Throughput: {timing['orders_per_hour']} orders/hour over {timing['run_seconds']} s
+        Slowest steps: {slowest_steps(timing)}"""
+
+        outbox.send(subject, body)
+        return len(successful_orders), len(failed_orders)
 
     except Exception as e:
-        send_email("FNET Bot Failed", f"FNET bot failed with error: {str(e)}")
+        step_timer.report(orders=0)
+        outbox.send("FNET Bot Failed", f"FNET bot failed with error: {str(e)}")
         raise
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="place FNet orders from FTP and update tracking")
+    parser.add_argument('command', nargs='?', default='all', choices=['orders', 'tracking', 'all', 'inventory'],
+                        help="orders: place new orders, tracking: update tracking numbers, all: both (default), "
+                             "inventory: upload the inventory feed")
+    parser.add_argument('--full', action='store_true', help="inventory: upload every sku instead of only the changes")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    try:
+        if args.command in ('orders', 'all'):
+            place_orders()
+        if args.command in ('tracking', 'all'):
+            from scrape_tracking import scrape_tracking
+            scrape_tracking()
+        if args.command == 'inventory':
+            from inventory_feed import update_inventory_feed
+            update_inventory_feed(full=True if args.full else None)
+    finally:
+        outbox.close() # delivers the queued summary and digest before exiting
+        startup.report(args.command)
+
 if __name__ == '__main__':
-    place_orders()
-    scrape_tracking()
\ No newline at end of file
+    main()
\ No newline at end of file
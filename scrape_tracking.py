@@ -1,40 +1,104 @@
 from utils.gsheet_setup import setup_google_sheets
-from bs4 import BeautifulSoup
-import cloudscraper
-import re
 import os
 import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from utils.rate_limit import TokenBucket
+from utils.tracking_state import TrackingState
+from utils.tracking_parser import parse_tracking_page
+from utils.sheet_writer import SheetWriter
+from utils.sheet_mirror import SheetMirror
+from utils.step_timing import step_timer
+from utils.scraper_pool import ScraperPool
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 BASE_URL = os.getenv("TRACKING_BASE_URL")
 
-# create a session
-def create_scraper_session():
-    scraper = cloudscraper.create_scraper()
-    return scraper
+# concurrency and rate limiting toward the tracking site
+TRACKING_WORKERS = int(os.getenv('TRACKING_WORKERS', '4'))
+TRACKING_REQUESTS_PER_SECOND = float(os.getenv('TRACKING_REQUESTS_PER_SECOND', '2'))
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 2 # doubled on every retry
+VERIFY_CELLS_PER_CALL = 200 # target cells read back per batch_get before writing tracking
+
+rate_limiter = TokenBucket(TRACKING_REQUESTS_PER_SECOND, capacity=max(1, TRACKING_WORKERS))
+
+# per request latency stats
+stats_lock = threading.Lock()
+latencies = []
+retries = 0
+
+# pool of cloudflare cleared sessions, saved between runs
+def create_scraper_pool():
+    return ScraperPool(pool_maxsize=TRACKING_WORKERS)
+
+# rate limited get on the healthiest pooled session. a 403 rotates that session out and retries
+# straight away on another one, 5xx and connection errors are retried with backoff
+def fetch_tracking_page(url, pool):
+    global retries
+    session = None
+    for attempt in range(MAX_RETRIES + 1):
+        session = pool.checkout(avoid=session)
+        rate_limiter.acquire()
+        start = time.monotonic()
+        with step_timer.span('tracking.fetch') as span:
+            try:
+                response = session.scraper.get(url)
+            except Exception:
+                pool.release(session, ok=False)
+                if attempt == MAX_RETRIES:
+                    raise
+                response = None
+            else:
+                status = response.status_code
+                pool.release(session, ok=status != 403 and status < 500, denied=status == 403)
+            span['ok'] = response is not None and response.status_code < 400
+        with stats_lock:
+            latencies.append(time.monotonic() - start)
+
+        if response is not None and response.status_code != 403 and response.status_code < 500:
+            return response
+        if attempt < MAX_RETRIES:
+            with stats_lock:
+                retries += 1
+            if response is None or response.status_code != 403:
+                time.sleep(BACKOFF_SECONDS * 2 ** attempt + random.uniform(0, 1))
+    return response
+
+def reset_latency_stats():
+    global retries
+    with stats_lock:
+        latencies.clear()
+        retries = 0
+
+def latency_stats():
+    with stats_lock:
+        samples = sorted(latencies)
+        retry_count = retries
+    if not samples:
+        return {'requests': 0, 'retries': retry_count}
+    pick = lambda q: round(samples[int(q * (len(samples) - 1))], 3)
+    return {'requests': len(samples), 'retries': retry_count, 'p50': pick(0.5), 'p95': pick(0.95), 'max': round(samples[-1], 3)}
 
 # scrape tracking numbers
-def scrape_tracking_info(order_number, scraper):
+def scrape_tracking_info(order_number, pool):
     url = f"{BASE_URL}{order_number}"
 
-    response = scraper.get(url)
+    response = fetch_tracking_page(url, pool)
     
     if response.status_code == 403:
-        print(f"access denied for order {order_number}. cloudflare challenge failed.")
+        logger.warning(f"access denied for order {order_number}. cloudflare challenge failed.")
         return "Unknown", None  # return "Unknown" for vendor if session fails
 
     response.raise_for_status()
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    vendor_tag = soup.find("strong", string=re.compile(r"Shipment Vendor"))
-    shipment_vendor = vendor_tag.next_sibling.strip() if vendor_tag else "Unknown"
-
-    tracking_tag = soup.find("strong", string=re.compile(r"Shipment Tracking"))
-    tracking_number = tracking_tag.find_next("a").text.strip() if tracking_tag else None
-
-    return shipment_vendor, tracking_number
+    return parse_tracking_page(response.text)
 
 # update sheets with fulfillment info
 # def update_sheet_with_tracking(sheet, scraper):
@@ -56,41 +120,118 @@ def scrape_tracking_info(order_number, scraper):
 #             else:
 #                 print(f"No tracking number found for order: {order_number}")
 
-def update_sheet_with_tracking(sheet, scraper):
-    rows = sheet.get_all_values()
+# order number -> current sheet row, None for orders no longer in the sheet. rows inserted, deleted
+# or sorted by hand leave the mirror pointing at the wrong rows, so column B of each target row is
+# read back first and the mirror is rebuilt if any of them no longer holds its order
+def locate_rows(sheet, mirror, state, order_numbers):
+    if not order_numbers:
+        return {}
+    rows = {order_number: mirror.row_for_fnet(order_number) for order_number in order_numbers}
+    if all(rows.values()):
+        targets = list(rows.items())
+        cells = []
+        for i in range(0, len(targets), VERIFY_CELLS_PER_CALL):
+            cells.extend(sheet.batch_get([f"B{row}" for _, row in targets[i:i + VERIFY_CELLS_PER_CALL]]))
+        value = lambda cell: cell[0][0].strip() if cell and cell[0] else ''
+        if all(value(cell) == order_number for (order_number, _), cell in zip(targets, cells)):
+            return rows
+    logger.warning("sheet rows moved since the mirror was synced, rebuilding it")
+    mirror.rebuild(sheet)
+    state.resync_rows(mirror)
+    return {order_number: mirror.row_for_fnet(order_number) for order_number in order_numbers}
+
+def update_sheet_with_tracking(sheet, pool):
+    # only orders that are due on the re-check schedule get scraped, the sheet is read incrementally
+    mirror = SheetMirror()
+    new_rows = mirror.sync(sheet)
+    state = TrackingState()
+    state.sync(mirror)
+    pending = state.due_orders()
+    logger.info(f"synced {new_rows} new sheet rows, {len(pending)} orders due for a tracking check")
+    if pending and pool is None:
+        pool = create_scraper_pool()
 
     batch_updates = []
     row_indices = []
+    found_orders = []
+
+    def lookup(order_number):
+        logger.info(f"processing order number: {order_number}")
+        try:
+            return scrape_tracking_info(order_number, pool)
+        except Exception as e:
+            logger.error(f"error scraping tracking for order {order_number}: {e}")
+            return "Unknown", None
+
+    # scrape concurrently, results come back in sheet order
+    with ThreadPoolExecutor(max_workers=max(1, TRACKING_WORKERS)) as executor:
+        results = list(executor.map(lookup, [order_number for _, order_number in pending]))
+
+    found = []
+    for (i, order_number), (carrier, tracking_number) in zip(pending, results):
+        if tracking_number:
+            found.append((order_number, carrier, tracking_number))
+        else:
+            state.record_check(order_number, found=False)
+            logger.info(f"No tracking number found for order: {order_number}")
+
+    rows = locate_rows(sheet, mirror, state, [order_number for order_number, _, _ in found])
+    for order_number, carrier, tracking_number in found:
+        i = rows.get(order_number)
+        if i is None:
+            logger.warning(f"order {order_number} is no longer in the sheet, not writing its tracking") # resync_rows closed it
+            continue
+        # add to batch updates
+        row_indices.append(i)
+        found_orders.append(order_number)
+        batch_updates.append({'range': f'C{i}:D{i}', 'values': [[carrier, tracking_number]]})
+        logger.info(f"Queued update for row {i}: Carrier: {carrier}, Tracking Number: {tracking_number}")
+
+    logger.info(f"tracking request latency: {latency_stats()}")
+    if pool is not None:
+        pool.save()
+        logger.info(f"scraper sessions: {pool.stats}, health {pool.health()}")
     
-    for i, row in enumerate(rows[1:], start=2):
-        order_number = row[1].strip() if len(row) > 1 else ""  # col B (order number)
-        shipment_vendor = row[2].strip() if len(row) > 2 else ""  # col C (carrier)
-        tracking_number = row[3].strip() if len(row) > 3 else ""  # col D (tracking number)
-        
-        if order_number and not tracking_number:  # only if col B has an order number and D is blank
-            print(f"processing order number: {order_number}")
-            carrier, tracking_number = scrape_tracking_info(order_number, scraper)
-            
-            if tracking_number:
-                # add to batch updates
-                row_indices.append(i)
-                batch_updates.append({'range': f'C{i}:D{i}', 'values': [[carrier, tracking_number]]})
-                print(f"Queued update for row {i}: Carrier: {carrier}, Tracking Number: {tracking_number}")
-            else:
-                print(f"No tracking number found for order: {order_number}")
-    
-    #process batch updates in chunks to stay within googles quota limits
-    chunk_size = 10
-    for i in range(0, len(batch_updates), chunk_size):
-        chunk = batch_updates[i:i+chunk_size]
-        if chunk:
-            # use batch_update for multiple updates at once
-            sheet.batch_update(chunk)
-            print(f"Processed batch update for rows: {row_indices[i:i+chunk_size]}")
-            time.sleep(1)  #delay to avoid rate limits
-
-
-def scrape_tracking():
-    scraper = create_scraper_session()
-    sheet = setup_google_sheets()
-    update_sheet_with_tracking(sheet, scraper)
+    # all updates go out as one merged, rate limited batch. failures are spooled and replayed next run
+    writer = SheetWriter(sheet)
+    for update in batch_updates:
+        writer.update(update['range'], update['values'])
+    writer.flush()
+    if batch_updates:
+        logger.info(f"Processed batch update for rows: {row_indices}")
+    # an order only counts as found once its tracking is in the sheet, spooled ones are checked again
+    for i, order_number, update in zip(row_indices, found_orders, batch_updates):
+        if update['range'] not in writer.written_ranges:
+            logger.warning(f"tracking for order {order_number} was not written to row {i}, it stays due")
+            continue
+        state.record_check(order_number, found=True)
+        mirror.record_update(i, *update['values'][0])
+
+    state.close()
+    mirror.close()
+
+
+def scrape_tracking(sheet=None, pool=None):
+    # check the local state first, so a run with nothing due never authenticates to sheets or
+    # solves a cloudflare challenge. rows we write are already in the mirror, others are picked up
+    # by the delta sync whenever there is work
+    mirror = SheetMirror()
+    state = TrackingState()
+    try:
+        if mirror.last_row() is not None:
+            state.sync(mirror)
+            if not state.due_orders():
+                logger.info('no tracking checks due. exiting')
+                return
+    finally:
+        state.close()
+        mirror.close()
+
+    step_timer.start_run('tracking')
+    reset_latency_stats()
+    try:
+        sheet = sheet or setup_google_sheets()
+        update_sheet_with_tracking(sheet, pool)
+    finally:
+        timing = step_timer.report()
+        logger.info(f"tracking run took {timing['run_seconds']} s")
@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import logging
+import subprocess
+from collections import deque
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from selenium.webdriver.common.by import By
+from utils.selenium_setup import get_driver
+from login import fnet_login
+from utils.step_timing import step_timer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+RECYCLE_EVENTS_FILE = os.path.join(STATE_DIR, 'recycle_events.jsonl')
+# chrome is relaunched between POs once any of these is crossed
+CHROME_MAX_RSS_MB = float(os.getenv('CHROME_MAX_RSS_MB', '1500')) # chrome process tree resident memory
+CHROME_MAX_PAGE_LOADS = int(os.getenv('CHROME_MAX_PAGE_LOADS', '400')) # main frame page loads on one process
+CHROME_MAX_ERROR_RATE = float(os.getenv('CHROME_MAX_ERROR_RATE', '0.5')) # failed share of the last ERROR_WINDOW POs
+ERROR_WINDOW = 6
+WELCOME_SELECTOR = "div.welcome span[role='heading']"
+
+EMPTY_STATS = {
+    'launches': 0, 'logins': 0, 'cookie_restores': 0, 'reuses': 0,
+    'bytes': 0, 'requests': 0, 'blocked_requests': 0, 'page_loads': 0, 'page_load_seconds': 0.0,
+    'recycles': 0, 'session_resets': 0,
+}
+
+# resident memory of a process and all its descendants in MB, None if it can't be read.
+# uses psutil when installed, ps otherwise
+def process_tree_rss_mb(pid):
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+            total = 0
+            for process in processes:
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total / 1048576
+        except psutil.Error:
+            return None
+
+    try:
+        output = subprocess.run(['ps', '-A', '-o', 'pid=,ppid=,rss='], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    children = {}
+    rss = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) != 3 or not all(part.isdigit() for part in parts):
+            continue
+        child, parent, kb = map(int, parts)
+        children.setdefault(parent, []).append(child)
+        rss[child] = kb
+    if pid not in rss:
+        return None
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total / 1024
+
+# (username, password) for a worker. worker 0 uses LOGIN_USERNAME, worker n LOGIN_USERNAME_<n>.
+# the fnet bag belongs to the account, so workers must never share one
+def worker_credentials(worker_id):
+    suffix = f"_{worker_id}" if worker_id else ""
+    username = os.getenv(f"LOGIN_USERNAME{suffix}")
+    password = os.getenv(f"LOGIN_PASSWORD{suffix}")
+    return (username, password) if username and password else None
+
+# the number of workers that can run, one per configured account
+def usable_workers(requested):
+    requested = max(1, requested)
+    workers = 1
+    while workers < requested and worker_credentials(workers):
+        workers += 1
+    if workers < requested:
+        logger.warning(f"NUM_WORKERS={requested} but only {workers} fnet accounts configured "
+                       f"(LOGIN_USERNAME_n / LOGIN_PASSWORD_n), running {workers} workers")
+    return workers
+
+def site_home_url():
+    login_url = urlparse(os.getenv('LOGIN_URL'))
+    return f"{login_url.scheme}://{login_url.netloc}/"
+
+# keeps one warm chrome + fnet session for a worker, relaunching or relogging only when needed.
+# each worker logs into its own account with its own cookie file, so parallel workers never share a cart.
+class DriverManager:
+    def __init__(self, worker_id=0):
+        self.worker_id = worker_id
+        self.cookies_file = os.path.join(STATE_DIR, f'fnet_cookies_{worker_id}.json')
+        self.driver = None
+        self.orders_on_driver = 0
+        self.page_loads_on_driver = 0
+        self.cart_dirty = True # the account's bag may hold items from a failed or interrupted PO
+        self.recent_results = deque(maxlen=ERROR_WINDOW) # True for each PO on this driver that failed on a browser or site error
+        self.recycle_events = []
+        self.stats = dict(EMPTY_STATS)
+
+    # return a logged in driver with an empty cart, or None if login failed
+    def get(self):
+        driver = self._session()
+        if driver is not None and self.cart_dirty:
+            from checkout import empty_cart
+            empty_cart(driver)
+            self.cart_dirty = False
+        return driver
+
+    def _session(self):
+        if self.driver is not None and self._browser_alive():
+            if self._logged_in():
+                self.stats['reuses'] += 1
+                return self.driver
+            logger.info(f"worker {self.worker_id}: session expired, logging in again")
+            return self._login()
+
+        self._quit()
+        with step_timer.span('browser.launch'):
+            self.driver = get_driver()
+        self.orders_on_driver = 0
+        self.page_loads_on_driver = 0
+        self.recent_results.clear()
+        self.stats['launches'] += 1
+
+        if self._restore_cookies():
+            self.stats['cookie_restores'] += 1
+            logger.info(f"worker {self.worker_id}: restored saved session, skipped login")
+            return self.driver
+        return self._login()
+
+    # per run counters, the warm browser and its recycle thresholds carry over
+    def reset_stats(self):
+        self.stats = dict(EMPTY_STATS)
+        self.recycle_events = []
+
+    # call between POs (never mid checkout), recycles chrome once memory, page loads or errors cross a threshold
+    def order_done(self, failed=False):
+        self.collect_network_stats()
+        if self.driver is None:
+            return
+        self.orders_on_driver += 1
+        self.recent_results.append(failed)
+        reason = self.recycle_reason()
+        if reason:
+            logger.info(f"worker {self.worker_id}: recycling chrome after {self.orders_on_driver} orders, {reason[1]}")
+            self.record_recycle(*reason)
+            self.recycle()
+
+    # (kind, detail) for the first threshold crossed, or None
+    def recycle_reason(self):
+        if self.page_loads_on_driver >= CHROME_MAX_PAGE_LOADS:
+            return 'page_loads', f"{self.page_loads_on_driver} page loads"
+        if len(self.recent_results) == ERROR_WINDOW:
+            error_rate = sum(self.recent_results) / ERROR_WINDOW
+            if error_rate >= CHROME_MAX_ERROR_RATE:
+                return 'error_rate', f"error rate {error_rate:.0%} over the last {ERROR_WINDOW} orders"
+        rss_mb = self.chrome_rss_mb()
+        if rss_mb is not None and rss_mb >= CHROME_MAX_RSS_MB:
+            return 'memory', f"chrome using {rss_mb:.0f} MB"
+        return None
+
+    # uc exposes the browser pid, plain selenium only the chromedriver pid (chrome is its child)
+    def chrome_rss_mb(self):
+        pid = getattr(self.driver, 'browser_pid', None)
+        if pid is None:
+            process = getattr(getattr(self.driver, 'service', None), 'process', None)
+            pid = getattr(process, 'pid', None)
+        return process_tree_rss_mb(pid) if pid else None
+
+    def record_recycle(self, kind, reason):
+        event = {
+            'ts': time.time(),
+            'worker': self.worker_id,
+            'kind': kind,
+            'reason': reason,
+            'orders': self.orders_on_driver,
+            'page_loads': self.page_loads_on_driver,
+        }
+        self.recycle_events.append(event)
+        self.stats['recycles'] += 1
+        try:
+            os.makedirs(STATE_DIR, exist_ok=True)
+            with open(RECYCLE_EVENTS_FILE, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+        except OSError as e:
+            logger.warning(f"could not save recycle event: {e}")
+
+    # drop chrome but keep the session cookies for the next launch
+    def recycle(self):
+        self._save_cookies()
+        self._quit()
+
+    # log out after a failed order, the next get() logs in again and empties the cart. chrome
+    # keeps running so the failure counts toward its error rate, it is only relaunched if clearing fails
+    def reset_session(self, reason=None):
+        self.stats['session_resets'] += 1
+        self.cart_dirty = True
+        try:
+            os.remove(self.cookies_file)
+        except OSError:
+            pass
+        if self.driver is None:
+            return
+        logger.info(f"worker {self.worker_id}: resetting session{f' after {reason}' if reason else ''}")
+        try:
+            # cookies can only be cleared for the domain the driver is on, the reload shows the logged out page
+            self.driver.get(site_home_url())
+            self.driver.delete_all_cookies()
+            self.driver.get(site_home_url())
+        except Exception as e:
+            logger.warning(f"worker {self.worker_id}: could not clear the session, relaunching chrome: {e}")
+            self._quit()
+
+    def close(self):
+        self.recycle()
+
+    def _login(self):
+        username, password = worker_credentials(self.worker_id) or (None, None)
+        self.stats['logins'] += 1
+        with step_timer.span('fnet_login') as span:
+            span['ok'] = fnet_login(self.driver, username, password)
+        if not span['ok']:
+            self._quit()
+            return None
+        self._save_cookies()
+        return self.driver
+
+    def _browser_alive(self):
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def _logged_in(self):
+        try:
+            elements = self.driver.find_elements(By.CSS_SELECTOR, WELCOME_SELECTOR)
+            return any("Welcome" in element.text for element in elements)
+        except Exception:
+            return False
+
+    def _restore_cookies(self):
+        try:
+            with open(self.cookies_file) as f:
+                cookies = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        now = time.time()
+        cookies = [c for c in cookies if not c.get('expiry') or c['expiry'] > now]
+        if not cookies:
+            return False
+
+        try:
+            # cookies can only be set for the domain the driver is currently on
+            self.driver.get(site_home_url())
+            for cookie in cookies:
+                cookie.pop('sameSite', None)
+                self.driver.add_cookie(cookie)
+            self.driver.get(site_home_url())
+            return self._logged_in()
+        except Exception as e:
+            logger.warning(f"worker {self.worker_id}: could not restore session cookies: {e}")
+            return False
+
+    def _save_cookies(self):
+        if self.driver is None:
+            return
+        try:
+            cookies = self.driver.get_cookies()
+            os.makedirs(STATE_DIR, exist_ok=True)
+            with open(self.cookies_file, 'w') as f:
+                json.dump(cookies, f)
+        except Exception as e:
+            logger.warning(f"worker {self.worker_id}: could not save session cookies: {e}")
+
+    # fold the driver's traffic and page load times into this manager's stats
+    def collect_network_stats(self):
+        network = getattr(self.driver, 'network_stats', None)
+        if network is None:
+            return
+        network.collect(self.driver)
+        self.stats['bytes'] += network.bytes
+        self.stats['requests'] += network.requests
+        self.stats['blocked_requests'] += network.blocked
+        self.stats['page_loads'] += len(network.page_loads)
+        self.stats['page_load_seconds'] += sum(network.page_loads)
+        self.page_loads_on_driver += len(network.page_loads)
+        network.bytes = network.requests = network.blocked = 0
+        network.page_loads = []
+
+    def _quit(self):
+        if self.driver is not None:
+            self.collect_network_stats()
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+# totals across all workers, plus launches/logins avoided against the old
+# one-launch-and-login-per-15-orders-per-file baseline
+def session_report(managers, baseline_sessions, orders=0):
+    totals = dict(EMPTY_STATS)
+    for manager in managers:
+        for key, value in manager.stats.items():
+            totals[key] += value
+    totals['launches_avoided'] = max(0, baseline_sessions - totals['launches'])
+    totals['logins_avoided'] = max(0, baseline_sessions - totals['logins'])
+    totals['kb_per_order'] = round(totals['bytes'] / 1024 / orders, 1) if orders else 0
+    totals['avg_page_load_seconds'] = round(totals['page_load_seconds'] / totals['page_loads'], 2) if totals['page_loads'] else 0
+    reasons = {}
+    for manager in managers:
+        for event in manager.recycle_events:
+            reasons[event['kind']] = reasons.get(event['kind'], 0) + 1
+    totals['recycle_reasons'] = reasons
+    return totals
@@ -3,13 +3,30 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 import os
+import json
+import time
+import queue
+import logging
+import threading
 
 load_dotenv()
 
-def send_email(subject, body):
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+EMAIL_OUTBOX_FILE = os.path.join(STATE_DIR, 'email_outbox.jsonl') # mail that could not be sent, retried next run
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', '1') == '1'
+SMTP_TIMEOUT = 30
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '4'))
+EMAIL_RETRY_SECONDS = float(os.getenv('EMAIL_RETRY_SECONDS', '5')) # doubled on every retry
+FAILURE_DIGEST_MINUTES = float(os.getenv('FAILURE_DIGEST_MINUTES', '60')) # daemon mode, one-shot runs send on exit
+SMTP_IDLE_SECONDS = 120 # the connection is dropped after this long without mail
+
+def build_message(subject, body):
     sender_email = os.getenv('SENDER_EMAIL')
     receiver_email = os.getenv('RECEIVER_EMAIL')
-    email_password = os.getenv('EMAIL_PASSWORD')
 
     # create email msg headers
     msg = MIMEMultipart()
@@ -19,16 +36,223 @@ def send_email(subject, body):
 
     # create email msg body
     msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+def smtp_connect():
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    try:
+        if SMTP_STARTTLS:
+            server.starttls()
+        email_password = os.getenv('EMAIL_PASSWORD')
+        if email_password:
+            server.login(os.getenv('SENDER_EMAIL'), email_password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+# send one email right away on its own connection
+def send_email(subject, body):
+    msg = build_message(subject, body)
+    server = None
 
     # connect to the server and send the email
     try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, email_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
-        print("email sent successfully")
+        server = smtp_connect()
+        server.sendmail(msg['From'], msg['To'], msg.as_string())
+        logger.info("email sent successfully")
     except Exception as e:
-        print(f"failed to send email: {e}")
+        logger.error(f"failed to send email: {e}")
     finally:
-        server.quit()
\ No newline at end of file
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+# background mail sender. send() and failure() only queue, a single thread delivers over one
+# reused smtp connection with retries. per PO failures are batched into a digest sent every
+# FAILURE_DIGEST_MINUTES. every mail is written to the outbox file before it is queued and
+# removed once sent, so mail the process didn't get to (smtp down, exit mid retry) goes out next run
+class Outbox:
+    def __init__(self, path=EMAIL_OUTBOX_FILE, digest_minutes=FAILURE_DIGEST_MINUTES):
+        self.path = path
+        self.digest_seconds = digest_minutes * 60
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = {} # mail id -> {'ts', 'subject', 'body'}, mirrored in the outbox file
+        self.next_id = 0
+        self.unsent = [] # ids that ran out of attempts, retried after the next mail gets through
+        self.failures = []
+        self.digest_due = None
+        self.server = None
+        self.last_sent = 0.0
+        self.thread = None
+        self.stats = {'sent': 0, 'retries': 0, 'connections': 0, 'unsent': 0, 'digests': 0}
+
+    def _start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self._load_outbox()
+            self.thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+            self.thread.start()
+
+    def send(self, subject, body):
+        self._start()
+        self._enqueue(subject, body)
+
+    # one line per failed PO, mailed together in the next digest
+    def failure(self, po_num, reason, file=None, attempts=1):
+        self._start()
+        with self.lock:
+            self.failures.append({'ts': time.time(), 'po_num': po_num, 'file': file, 'attempts': attempts, 'reason': str(reason)})
+            if self.digest_due is not None:
+                return
+            self.digest_due = time.monotonic() + self.digest_seconds
+        self.queue.put(('wake',)) # the sender may be sleeping on an older timeout
+
+    # send the pending digest and wait for everything queued so far to be delivered or kept
+    def flush(self, timeout=None):
+        if self.thread is None:
+            return
+        self._queue_digest()
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        done.wait(timeout)
+
+    # the digest is written out before waiting, so a timeout leaves nothing only in memory
+    def close(self, timeout=120):
+        if self.thread is None:
+            return
+        self._queue_digest()
+        done = threading.Event()
+        self.queue.put(('stop', done))
+        if not done.wait(timeout):
+            with self.lock:
+                unsent = len(self.pending)
+            logger.error(f"email outbox still busy after {timeout}s, {unsent} emails kept in {self.path} for the next run")
+        self.thread.join(1)
+        self.thread = None
+
+    def _enqueue(self, subject, body):
+        with self.lock:
+            self.next_id += 1
+            mail_id = self.next_id
+            self.pending[mail_id] = {'ts': time.time(), 'subject': subject, 'body': body}
+            self._write_outbox()
+        self.queue.put(('mail', mail_id))
+
+    def _run(self):
+        while True:
+            with self.lock:
+                due = self.digest_due
+            wait = SMTP_IDLE_SECONDS if due is None else max(0.0, due - time.monotonic())
+            try:
+                kind, *args = self.queue.get(timeout=wait)
+            except queue.Empty:
+                kind, args = 'idle', []
+
+            if due is not None and time.monotonic() >= due:
+                self._queue_digest()
+            if kind == 'mail':
+                self._deliver(args[0])
+            elif kind == 'idle' and self.server is not None and time.monotonic() - self.last_sent >= SMTP_IDLE_SECONDS:
+                self._disconnect()
+            elif kind == 'stop':
+                # the queue is fifo, everything sent before close() has been handled
+                self._disconnect()
+                args[0].set()
+                return
+            elif kind == 'flush':
+                args[0].set()
+
+    def _queue_digest(self):
+        with self.lock:
+            failures, self.failures = self.failures, []
+            self.digest_due = None
+        if not failures:
+            return
+        lines = []
+        for f in failures:
+            where = f" ({f['file']})" if f['file'] else ''
+            tries = f", {f['attempts']} attempts" if f['attempts'] > 1 else ''
+            lines.append(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(f['ts']))}  PO {f['po_num']}{where}{tries}: {f['reason']}")
+        self.stats['digests'] += 1
+        self._enqueue(f"FNET Failed Orders ({len(failures)})", '\n'.join(lines))
+
+    def _deliver(self, mail_id):
+        with self.lock:
+            mail = self.pending.get(mail_id)
+        if mail is None:
+            return
+        subject = mail['subject']
+        msg = build_message(subject, mail['body'])
+        for attempt in range(EMAIL_MAX_ATTEMPTS):
+            try:
+                if self.server is None:
+                    self.server = smtp_connect()
+                    self.stats['connections'] += 1
+                self.server.sendmail(msg['From'], msg['To'], msg.as_string())
+                self.last_sent = time.monotonic()
+                self.stats['sent'] += 1
+                logger.info(f"email sent: {subject}")
+                with self.lock:
+                    self.pending.pop(mail_id, None)
+                    self._write_outbox()
+                    retry, self.unsent = self.unsent, []
+                for unsent_id in retry:
+                    self.queue.put(('mail', unsent_id))
+                return True
+            except Exception as e:
+                logger.warning(f"email attempt {attempt + 1} of {EMAIL_MAX_ATTEMPTS} failed: {e}")
+                self._disconnect()
+                if attempt + 1 < EMAIL_MAX_ATTEMPTS:
+                    self.stats['retries'] += 1
+                    time.sleep(EMAIL_RETRY_SECONDS * 2 ** attempt)
+        self.stats['unsent'] += 1
+        with self.lock:
+            self.unsent.append(mail_id)
+        logger.error(f"could not send email '{subject}', kept in {self.path} for the next run")
+        return False
+
+    def _disconnect(self):
+        server, self.server = self.server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    # called with the lock held
+    def _write_outbox(self):
+        try:
+            if not self.pending:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                for mail in self.pending.values():
+                    f.write(json.dumps(mail) + '\n')
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"could not write email outbox {self.path}: {e}")
+
+    # called with the lock held, queues mail a previous run didn't send
+    def _load_outbox(self):
+        try:
+            with open(self.path) as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return
+        for entry in entries:
+            self.next_id += 1
+            self.pending[self.next_id] = {'ts': entry.get('ts', time.time()), 'subject': entry['subject'], 'body': entry['body']}
+            self.queue.put(('mail', self.next_id))
+        if entries:
+            logger.info(f"resending {len(entries)} emails from an earlier run")
+
+outbox = Outbox()
@@ -1,27 +1,36 @@
 import os
+import json
+import queue
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv 
 from ftplib import FTP, error_perm, error_temp, error_reply
+from utils.step_timing import step_timer
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 FTP_HOST = os.getenv('FTP_HOST')
 FTP_USER = os.getenv('FTP_USER')
 FTP_PASS = os.getenv('FTP_PASS')
+FTP_PORT = int(os.getenv('FTP_PORT', '21'))
+FTP_POOL_SIZE = int(os.getenv('FTP_POOL_SIZE', '3')) # parallel download connections
 LOCAL_ORDERS_DIR = os.getenv('LOCAL_ORDERS_DIR')
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+SEEN_FILES_PATH = os.path.join(STATE_DIR, 'ftp_seen.json')
 
 # remote FTP directories
 REMOTE_ORDERS_DIR = '/out/orders'
 REMOTE_ORDER_ARCHIVE_DIR = '/out/orders/archive' 
 REMOTE_INVENTORY_DIR = '/in/inventory'
 
+@step_timer.timed('ftp.connect')
 def connect_ftp():
    try:
-       ftp = FTP(FTP_HOST)
+       ftp = FTP()
+       ftp.connect(FTP_HOST, FTP_PORT)
        ftp.login(FTP_USER, FTP_PASS)
        logger.info(f"successfully connected to FTP server: {FTP_HOST}")
        return ftp
@@ -29,29 +38,132 @@ def connect_ftp():
        logger.error(f"FTP connection error: {e}")
        return None
 
+# (name, size, modify) for each csv in the orders dir. MLSD gives size and mtime in one
+# listing, servers without it fall back to NLST with unknown size/mtime
+@step_timer.timed('ftp.list')
+def list_order_files(ftp):
+   ftp.cwd(REMOTE_ORDERS_DIR)
+   try:
+       entries = [
+           (name, int(facts['size']) if 'size' in facts else None, facts.get('modify'))
+           for name, facts in ftp.mlsd(facts=['type', 'size', 'modify'])
+           if facts.get('type', 'file') == 'file'
+       ]
+   except error_perm:
+       entries = [(name, None, None) for name in ftp.nlst()]
+   logger.info(f"list of files in remote directory: {[name for name, _, _ in entries]}")
+   return [entry for entry in entries if entry[0].endswith('.csv')]
+
+# files already fetched, keyed by name -> "size:modify" so a re-uploaded file with new content is fetched again
+def load_seen_files():
+   try:
+       with open(SEEN_FILES_PATH) as f:
+           return json.load(f)
+   except (OSError, ValueError):
+       return {}
+
+def save_seen_files(seen):
+   os.makedirs(STATE_DIR, exist_ok=True)
+   tmp_path = f"{SEEN_FILES_PATH}.tmp"
+   with open(tmp_path, 'w') as f:
+       json.dump(seen, f)
+   os.replace(tmp_path, SEEN_FILES_PATH)
+
+def file_signature(size, modify):
+   return f"{size}:{modify}"
+
+# download one file to LOCAL_ORDERS_DIR, resuming a partial .part download with REST
+@step_timer.timed('ftp.fetch')
+def fetch_file(ftp, file_name, size=None):
+   local_file_path = os.path.join(LOCAL_ORDERS_DIR, file_name)
+   part_path = f"{local_file_path}.part"
+   offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+   if size is not None and offset > size:
+       offset = 0 # remote file was replaced, start over
+
+   ftp.cwd(REMOTE_ORDERS_DIR)
+   with open(part_path, 'ab' if offset else 'wb') as local_file:
+       if offset:
+           logger.info(f"resuming {file_name} from byte {offset}")
+       ftp.retrbinary(f'RETR {file_name}', local_file.write, rest=offset or None)
+
+   if size is not None and os.path.getsize(part_path) != size:
+       raise IOError(f"incomplete download of {file_name}: {os.path.getsize(part_path)} of {size} bytes")
+   os.replace(part_path, local_file_path)
+   logger.info(f"downloaded: {file_name}")
+
+# listed order files that haven't been downloaded yet, cheap enough to poll
+def new_order_files(ftp, seen=None):
+   seen = load_seen_files() if seen is None else seen
+   csv_files = list_order_files(ftp)
+   new_files = [
+       (name, size, modify) for name, size, modify in csv_files
+       if size is None or seen.get(name) != file_signature(size, modify)
+   ]
+   skipped = len(csv_files) - len(new_files)
+   if skipped:
+       logger.info(f"skipping {skipped} files already downloaded")
+   return new_files
+
 def download_files(ftp):
    downloaded_files = []
    try:
-       ftp.cwd(REMOTE_ORDERS_DIR)
-       files = ftp.nlst()
-       logger.info(f"list of files in remote directory: {files}")
-       
-       csv_files = [f for f in files if f.endswith('.csv')]
-       if not csv_files:
-           return
-
-       for file_name in csv_files:
-           local_file_path = os.path.join(LOCAL_ORDERS_DIR, file_name)
-           with open(local_file_path, 'wb') as local_file:
-               ftp.retrbinary(f'RETR {file_name}', local_file.write)
-           downloaded_files.append(file_name)
-           logger.info(f"downloaded: {file_name}")
+       seen = load_seen_files()
+       new_files = new_order_files(ftp, seen)
+       if not new_files:
+           return []
+
+       if len(new_files) == 1 or FTP_POOL_SIZE <= 1:
+           for name, size, modify in new_files:
+               fetch_file(ftp, name, size)
+               downloaded_files.append(name)
+       else:
+           downloaded_files = download_parallel(new_files)
+
+       for name, size, modify in new_files:
+           if name in downloaded_files and size is not None:
+               seen[name] = file_signature(size, modify)
+       save_seen_files(seen)
 
        return downloaded_files
    except Exception as e:
        logger.error(f"error during file download: {e}")
-       return []
+       return downloaded_files
+
+# fetch files over a small pool of extra connections, returns the names that downloaded
+def download_parallel(files):
+   connections = queue.Queue()
+   opened = []
+
+   def fetch(entry):
+       name, size, _ = entry
+       try:
+           ftp = connections.get_nowait()
+       except queue.Empty:
+           ftp = connect_ftp()
+           if ftp is None:
+               return None
+           opened.append(ftp)
+       try:
+           fetch_file(ftp, name, size)
+           return name
+       except Exception as e:
+           logger.error(f"error downloading {name}: {e}")
+           return None
+       finally:
+           connections.put(ftp)
 
+   try:
+       with ThreadPoolExecutor(max_workers=min(FTP_POOL_SIZE, len(files))) as executor:
+           return [name for name in executor.map(fetch, files) if name]
+   finally:
+       for ftp in opened:
+           try:
+               ftp.quit()
+           except Exception:
+               pass
+
+@step_timer.timed('ftp.upload')
 def upload_files(ftp, local_file_path, remote_file_name):
    try:
        ftp.cwd(REMOTE_INVENTORY_DIR)
@@ -61,6 +173,8 @@ def upload_files(ftp, local_file_path, remote_file_name):
        logger.error(f"error during file upload: {e}")
        sys.exit(1)
 
+# move all files to the archive dir in one pass over a single connection
+@step_timer.timed('ftp.archive')
 def archive_files_on_ftp(ftp, files):
    try:
        try:
@@ -69,9 +183,15 @@ def archive_files_on_ftp(ftp, files):
            ftp.mkd(REMOTE_ORDER_ARCHIVE_DIR) # create archive dir if it doesn't exist
 
        ftp.cwd(REMOTE_ORDERS_DIR)
+       failed = []
        for file_name in files:
-           ftp.rename(file_name, f"{REMOTE_ORDER_ARCHIVE_DIR}/{file_name}") #move files from orders dir to archive dir
-           logger.info(f"archived file on FTP: {file_name}")
+           try:
+               ftp.rename(file_name, f"{REMOTE_ORDER_ARCHIVE_DIR}/{file_name}") #move files from orders dir to archive dir
+               logger.info(f"archived file on FTP: {file_name}")
+           except error_perm as e:
+               failed.append(file_name)
+               logger.error(f"error archiving {file_name} on FTP: {e}")
+       return failed
    except Exception as e:
        logger.error(f"error archiving files on FTP: {e}")
-       sys.exit(1)
\ No newline at end of file
+       sys.exit(1)
@@ -1,8 +1,16 @@
-import gspread
-from google.oauth2.service_account import Credentials
+import logging
+from utils.sheet_writer import SheetWriter
+from utils.sheet_mirror import SheetMirror
+from utils.step_timing import step_timer
+
+logger = logging.getLogger(__name__)
 
 # google sheets API setup
+@step_timer.timed('sheets.connect')
 def setup_google_sheets():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/spreadsheets",
              "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
     creds = Credentials.from_service_account_file('utils/gsheet_creds.json', scopes=scope)
@@ -10,16 +18,28 @@ def setup_google_sheets():
     sheet = client.open("fnet tracking").sheet1  # open the first sheet
     return sheet
 
-def add_po_num_fnet_num_to_sheet(sheet, po_num, order_number, po_num_col=1, fnet_num_col=2):
-    next_row = len(sheet.get_all_values()) + 1 # find the next available row
-    
-    # Update the specific columns with values
-    sheet.update_cell(next_row, po_num_col, po_num)
-    sheet.update_cell(next_row, fnet_num_col, order_number)
+def add_po_num_fnet_num_to_sheet(sheet, po_num, order_number):
+    batch_gsheet(sheet, [(po_num, order_number)])
 
+# append PO_num / fnet order number rows through the write-behind queue (no full sheet read).
+# POs already in the sheet mirror are skipped so a re-run never logs an order twice
 def batch_gsheet(sheet, orders):
-    start_row = len(sheet.get_all_values()) + 1
-    data = [[po_num, order_number] for po_num, order_number in orders]
-    end_row = start_row + len(data) - 1
-    cell_range = f"A{start_row}:B{end_row}"
-    sheet.update(cell_range, data)
+    mirror = SheetMirror()
+    try:
+        mirror.sync(sheet)
+        rows = []
+        for po_num, order_number in orders:
+            if mirror.row_for_po(po_num):
+                logger.info(f"PO {po_num} already in sheet at row {mirror.row_for_po(po_num)}, skipping")
+                continue
+            rows.append([po_num, order_number])
+
+        writer = SheetWriter(sheet)
+        writer.append_rows(rows)
+        appended = writer.flush()
+        if appended:
+            start_row, written = appended
+            mirror.record_written(start_row or mirror.next_free_row(), written)
+        return appended
+    finally:
+        mirror.close()
@@ -0,0 +1,129 @@
+import os
+import logging
+import threading
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+from utils.sku_cache import sku_cache
+from utils.scraper_pool import new_scraper
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HTTP_CART = os.getenv('HTTP_CART', '0') == '1' # build carts over http instead of the browser
+HTTP_TIMEOUT = 20
+
+class HttpCartError(Exception):
+    pass
+
+_local = threading.local()
+stats_lock = threading.Lock()
+stats = {'http_items': 0, 'ui_fallbacks': 0}
+
+def record(key):
+    with stats_lock:
+        stats[key] += 1
+
+def reset_stats():
+    with stats_lock:
+        for key in stats:
+            stats[key] = 0
+
+# one pooled scraper session per worker thread, reused across orders
+def pooled_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = new_scraper(pool_maxsize=4)
+        _local.session = session
+    return session
+
+# adds items to the logged in driver's cart over plain http using the driver's own cookies
+class HttpCart:
+    def __init__(self, driver):
+        self.driver = driver
+        self.session = pooled_session()
+        self.session.cookies.clear()
+        for cookie in driver.get_cookies():
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        self.session.headers['User-Agent'] = driver.execute_script("return navigator.userAgent;")
+        self.search = driver.execute_script(
+            "var i = document.getElementById('searchInput');"
+            "return i && i.form ? [i.form.action, (i.form.method || 'get').toLowerCase(), i.name] : null;"
+        )
+
+    def add_item(self, sku, quantity):
+        url, html = self.product_page(sku)
+        action, method, fields, quantity_field = cart_form(url, html)
+        if quantity_field:
+            fields[quantity_field] = str(quantity)
+        elif quantity > 1:
+            raise HttpCartError(f"no quantity field for sku {sku}")
+
+        response = self._send(method, action, fields)
+        if not response.ok:
+            raise HttpCartError(f"add to cart for sku {sku} returned {response.status_code}")
+
+    def product_page(self, sku):
+        cached = sku_cache.get(sku)
+        if cached:
+            response = self.session.get(cached['url'], timeout=HTTP_TIMEOUT)
+            if response.ok and 'id="brandTitle"' in response.text and sku in response.text:
+                return response.url, response.text
+            sku_cache.invalidate(sku)
+
+        if not self.search:
+            raise HttpCartError("search form not found on current page")
+        action, method, field = self.search
+        response = self._send(method, action, {field: sku})
+        if not response.ok or 'id="brandTitle"' not in response.text:
+            raise HttpCartError(f"sku {sku} did not resolve to a product page")
+        sku_cache.put(sku, response.url, item_code(response.text))
+        return response.url, response.text
+
+    # copy any cookies the site set (cart id etc.) back into the browser before checkout
+    def sync_to_driver(self):
+        for cookie in self.session.cookies:
+            try:
+                self.driver.add_cookie({'name': cookie.name, 'value': cookie.value, 'path': cookie.path or '/'})
+            except Exception as e:
+                logger.debug(f"could not copy cookie {cookie.name} to driver: {e}")
+
+    def _send(self, method, url, fields):
+        if method == 'post':
+            return self.session.post(url, data=fields, timeout=HTTP_TIMEOUT)
+        return self.session.get(url, params=fields, timeout=HTTP_TIMEOUT)
+
+def item_code(html):
+    tag = BeautifulSoup(html, 'html.parser').find('input', attrs={'name': 'mv_order_item'})
+    return tag.get('value') if tag else None
+
+# (action, method, fields, quantity field name) of the add to cart form on a product page
+def cart_form(page_url, html):
+    soup = BeautifulSoup(html, 'html.parser')
+    button = soup.find(id='addBagButton')
+    form = button.find_parent('form') if button else None
+    if form is None:
+        raise HttpCartError("add to cart form not found")
+
+    fields = {}
+    for tag in form.find_all(['input', 'select', 'textarea']):
+        name = tag.get('name')
+        if not name:
+            continue
+        input_type = (tag.get('type') or '').lower()
+        if input_type in ('checkbox', 'radio') and not tag.has_attr('checked'):
+            continue
+        if input_type in ('submit', 'button', 'image') and tag is not button:
+            continue
+        if tag.name == 'select':
+            option = tag.find('option', selected=True) or tag.find('option')
+            fields[name] = option.get('value', option.text) if option else ''
+        else:
+            fields[name] = tag.get('value', '')
+    if button.get('name'):
+        fields[button['name']] = button.get('value', '')
+
+    quantity = form.find(id='quantBox')
+    action = urljoin(page_url, form.get('action') or page_url)
+    return action, (form.get('method') or 'get').lower(), fields, quantity.get('name') if quantity else None
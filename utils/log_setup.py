@@ -0,0 +1,75 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE', os.path.join(STATE_DIR, 'logs', 'fnetbot.jsonl')) # empty disables the json log
+LOG_MAX_MB = float(os.getenv('LOG_MAX_MB', '10'))
+LOG_BACKUPS = int(os.getenv('LOG_BACKUPS', '5'))
+CONSOLE_FORMAT = "%(asctime)s [%(levelname)s] %(name)s - %(message)s"
+
+_listener = None
+
+# one json object per line, for grepping and shipping to a log store
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+# every logger writes to an in memory queue, a single listener thread does the console and file
+# io, so workers never block on a slow terminal or disk. safe to call more than once
+def setup_logging(level=LOG_LEVEL, log_file=LOG_FILE):
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handlers = [console]
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=int(LOG_MAX_MB * 1024 * 1024), backupCount=LOG_BACKUPS,
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    # chatty third party loggers stay at warning
+    for name in ('urllib3', 'selenium', 'undetected_chromedriver', 'gspread', 'google'):
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+# drain the queue and close the handlers, runs at exit
+def stop_logging():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
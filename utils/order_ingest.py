@@ -0,0 +1,125 @@
+import os
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = [
+    "PO_num", "First Name", "Last Name", "Ship To Address",
+    "Ship To City", "Ship To State", "Ship To Zip", "SKU", "Qty",
+]
+
+# stream (file, line number, row) from every order csv, skipping files with a bad header
+def iter_order_rows(orders_dir, files, rejected):
+    for file in files:
+        try:
+            with open(os.path.join(orders_dir, file), 'r', newline='') as f:
+                reader = csv.DictReader(f)
+                missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+                if missing:
+                    rejected.append((file, '', f"missing columns: {', '.join(missing)}"))
+                    logger.error(f"skipping {file}, missing columns: {missing}")
+                    continue
+                for line_number, row in enumerate(reader, start=2):
+                    yield file, line_number, row
+        except OSError as e:
+            rejected.append((file, '', f"could not read file: {e}"))
+            logger.error(f"could not read {file}: {e}")
+
+# stripped cell value, '' for the fields csv.DictReader leaves as None on a short line
+def cell(row, column):
+    return (row.get(column) or '').strip()
+
+def validate_row(row):
+    truncated = [column for column in REQUIRED_COLUMNS if row.get(column) is None]
+    if truncated:
+        return f"line ends early, missing {', '.join(truncated)}"
+    if not cell(row, "PO_num"):
+        return "missing PO_num"
+    if not cell(row, "SKU"):
+        return "missing SKU"
+    try:
+        if int(row["Qty"]) < 1:
+            return f"bad Qty {row['Qty']}"
+    except (TypeError, ValueError):
+        return f"bad Qty {row['Qty']}"
+    return None
+
+# merge every downloaded file into one ordered work queue of (source files, po_num, order) jobs.
+# a PO seen in several files is placed once: new lines are merged, lines already seen from another
+# file are dropped as a redelivery. POs for which skip_reason(po_num) returns a reason are skipped.
+# returns (jobs, rejected, skipped, pos_per_file), rejected and skipped being (file, po_num, reason) tuples
+def build_work_queue(orders_dir, files, skip_reason=None):
+    grouped_orders = {}
+    sources = {}
+    lines_seen = {}
+    bad_pos = {}
+    rejected = []
+    skipped = []
+    pos_per_file = {}
+
+    for file in files:
+        file_pos = set()
+        try:
+            for _, line_number, row in iter_order_rows(orders_dir, [file], rejected):
+                po_num = cell(row, "PO_num")
+                file_pos.add(po_num)
+                error = validate_row(row)
+                if error:
+                    bad_pos.setdefault(po_num, (file, f"line {line_number}: {error}"))
+                    continue
+
+                if po_num not in grouped_orders:
+                    grouped_orders[po_num] = {
+                        "shipping_info": {
+                            "fname": row["First Name"],
+                            "lname": row["Last Name"],
+                            "address1": row["Ship To Address"],
+                            "address2": row.get("Ship To Address 2") or "",
+                            "city": row["Ship To City"],
+                            "state": row["Ship To State"],
+                            "zip": row["Ship To Zip"],
+                        },
+                        "items": []
+                    }
+                    sources[po_num] = []
+                    lines_seen[po_num] = {}
+
+                if file not in sources[po_num]:
+                    sources[po_num].append(file)
+                    pos_per_file[file] = pos_per_file.get(file, 0) + 1
+
+                line = (row["SKU"], int(row["Qty"]))
+                first_file = lines_seen[po_num].setdefault(line, file)
+                if first_file != file:
+                    logger.warning(f"PO {po_num} line {line} in {file} already came from {first_file}, skipping duplicate")
+                    continue
+
+                grouped_orders[po_num]["items"].append({
+                    "sku": row["SKU"],
+                    "quantity": int(row["Qty"])
+                })
+        except Exception as e:
+            # one file that can't be read never stops the run, its POs are rejected rather than placed half built
+            logger.error(f"could not read {file}: {e}", exc_info=True)
+            rejected.append((file, '', f"could not read file: {e}"))
+            for po_num in file_pos:
+                bad_pos.setdefault(po_num, (file, f"could not read {file}: {e}"))
+
+    jobs = []
+    for po_num, order in grouped_orders.items():
+        source = '+'.join(sources[po_num])
+        reason = skip_reason(po_num) if skip_reason else None
+        if po_num in bad_pos:
+            rejected.append((source, po_num, bad_pos[po_num][1]))
+        elif reason:
+            logger.info(f"PO {po_num} from {source} skipped: {reason}")
+            skipped.append((source, po_num, reason))
+        else:
+            jobs.append((source, po_num, order))
+
+    for po_num, (file, reason) in bad_pos.items():
+        if po_num not in grouped_orders:
+            rejected.append((file, po_num, reason))
+
+    return jobs, rejected, skipped, pos_per_file
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+ORDER_JOURNAL_FILE = os.path.join(STATE_DIR, 'order_journal.jsonl')
+JOURNAL_RETENTION_DAYS = 30
+
+# per PO states, in order. recorded = written to the tracking sheet
+QUEUED = 'queued'
+CART_BUILT = 'cart_built'
+SUBMITTED = 'submitted'
+CONFIRMED = 'confirmed'
+FAILED = 'failed'
+RECORDED = 'recorded'
+
+# POs in these states must never be placed again
+DONE_STATES = (SUBMITTED, CONFIRMED, RECORDED)
+
+# append only, fsynced journal of every PO state change, so a restarted run knows what was already placed
+class OrderJournal:
+    def __init__(self, path=ORDER_JOURNAL_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.latest = {}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        line = '\n'
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # torn last line from a crash
+                    self.latest[entry['po_num']] = entry
+        except OSError:
+            pass
+        self.file = open(path, 'a')
+        if not line.endswith('\n'):
+            self.file.write('\n') # don't glue the next entry onto a torn line
+
+    def record(self, po_num, state, file=None, fnet_order_num=None, error=None):
+        previous = self.latest.get(po_num, {})
+        entry = {
+            'ts': time.time(),
+            'po_num': po_num,
+            'state': state,
+            'file': file or previous.get('file'),
+            'fnet_order_num': fnet_order_num or previous.get('fnet_order_num'),
+        }
+        if error:
+            entry['error'] = error
+        with self.lock:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.latest[po_num] = entry
+
+    def state(self, po_num):
+        entry = self.latest.get(po_num)
+        return entry['state'] if entry else None
+
+    def already_placed(self, po_num):
+        return self.state(po_num) in DONE_STATES
+
+    # confirmed orders that never made it into the sheet, as (po_num, fnet_order_num)
+    def unrecorded(self):
+        return [
+            (po_num, entry['fnet_order_num'])
+            for po_num, entry in self.latest.items()
+            if entry['state'] == CONFIRMED and entry.get('fnet_order_num')
+        ]
+
+    # rewrite the journal with one line per PO, dropping settled entries past retention
+    def compact(self):
+        cutoff = time.time() - JOURNAL_RETENTION_DAYS * 86400
+        with self.lock:
+            keep = {
+                po_num: entry for po_num, entry in self.latest.items()
+                if entry['ts'] >= cutoff or entry['state'] not in (RECORDED, FAILED)
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                for entry in keep.values():
+                    f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, 'a')
+            self.latest = keep
+
+    def close(self):
+        with self.lock:
+            self.file.close()
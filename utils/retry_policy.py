@@ -0,0 +1,125 @@
+import os
+import time
+import queue
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# in-run retries of transient checkout failures
+ORDER_MAX_ATTEMPTS = int(os.getenv('ORDER_MAX_ATTEMPTS', '3')) # attempts per PO, 1 disables retries
+ORDER_RETRY_BUDGET = int(os.getenv('ORDER_RETRY_BUDGET', '10')) # retries across the whole run
+ORDER_RETRY_BACKOFF_SECONDS = float(os.getenv('ORDER_RETRY_BACKOFF_SECONDS', '30')) # doubled on every retry
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# failures that will fail the same way on every attempt (unknown sku, bad state code, card decline)
+class PermanentOrderError(Exception):
+    pass
+
+# the site refused the card after the order was submitted, so nothing was placed
+class CardDeclinedError(PermanentOrderError):
+    pass
+
+# the cart doesn't hold exactly the PO's items, retried on a fresh session
+class CartMismatchError(Exception):
+    pass
+
+# transient: timeouts, stale elements, browser or connection errors and 5xx responses
+def classify_failure(error):
+    if isinstance(error, PermanentOrderError):
+        return PERMANENT
+    if isinstance(error, (TimeoutError, ConnectionError, CartMismatchError)):
+        return TRANSIENT
+    try:
+        from selenium.common.exceptions import WebDriverException
+    except ImportError:
+        WebDriverException = ()
+    if isinstance(error, WebDriverException):
+        return TRANSIENT # covers TimeoutException, StaleElementReferenceException, lost sessions
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None and status >= 500:
+        return TRANSIENT
+    return PERMANENT
+
+# hands out queued jobs and re-queues transient failures after a backoff, within a per PO attempt
+# limit and a retry budget for the run. workers keep pulling while any job is in flight or waiting
+# for its retry, so a requeued PO is never stranded
+class RetryScheduler:
+    def __init__(self, max_attempts=ORDER_MAX_ATTEMPTS, budget=ORDER_RETRY_BUDGET, backoff=ORDER_RETRY_BACKOFF_SECONDS):
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.delayed = [] # (due time, job)
+        self.in_flight = 0
+        self.stats = {'retries': 0, 'recovered': 0, 'budget_exhausted': 0}
+
+    # next job to work on, or None once the queue is drained and nothing is left to retry
+    def next_job(self, job_queue):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                due = [entry for entry in self.delayed if entry[0] <= now]
+                if due:
+                    self.delayed.remove(due[0])
+                    return self._start(due[0][1])
+                try:
+                    return self._start(job_queue.get_nowait())
+                except queue.Empty:
+                    pass
+                if not self.delayed and not self.in_flight:
+                    return None
+                wait = min([entry[0] for entry in self.delayed] + [now + 0.5]) - now
+            time.sleep(max(0.05, wait))
+
+    def _start(self, job):
+        self.in_flight += 1
+        po_num = job[1]
+        self.attempts[po_num] = self.attempts.get(po_num, 0) + 1
+        return job
+
+    def attempt(self, po_num):
+        return self.attempts.get(po_num, 1)
+
+    def succeeded(self, job):
+        with self.lock:
+            if self.attempts.get(job[1], 1) > 1:
+                self.stats['recovered'] += 1
+
+    # True if the job was requeued, False if it is out of attempts or the run is out of budget
+    def failed(self, job, retryable):
+        with self.lock:
+            attempt = self.attempts.get(job[1], 1)
+            if not retryable or attempt >= self.max_attempts:
+                return False
+            if self.budget <= 0:
+                self.stats['budget_exhausted'] += 1
+                return False
+            self.budget -= 1
+            self.stats['retries'] += 1
+            delay = self.backoff * 2 ** (attempt - 1)
+            self.delayed.append((time.monotonic() + delay, job))
+            logger.info(f"PO {job[1]} requeued for attempt {attempt + 1} in {delay:.0f}s")
+            return True
+
+    # every job from next_job() must be released exactly once, whatever happened to it
+    def release(self, job):
+        with self.lock:
+            self.in_flight -= 1
+
+    def waiting(self, job):
+        with self.lock:
+            return any(queued is job for _, queued in self.delayed)
+
+    # jobs still waiting for a retry, handed back if every worker crashed
+    def leftover(self):
+        with self.lock:
+            jobs = [job for _, job in self.delayed]
+            self.delayed = []
+            return jobs
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+SCRAPER_SESSIONS_FILE = os.path.join(STATE_DIR, 'scraper_sessions.json')
+SCRAPER_POOL_SIZE = int(os.getenv('SCRAPER_POOL_SIZE', '2'))
+SCRAPER_MIN_HEALTH = float(os.getenv('SCRAPER_MIN_HEALTH', '0.5')) # sessions scoring below this are rotated out
+HEALTH_DECAY = 0.8 # weight of the old score, every request moves the score 20% toward 1 (ok) or 0 (failed)
+
+# cloudscraper session with a connection pool sized for the threads sharing it
+def new_scraper(pool_maxsize=1):
+    import cloudscraper
+    from requests.adapters import HTTPAdapter
+
+    scraper = cloudscraper.create_scraper()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_maxsize))
+    scraper.mount('https://', adapter)
+    scraper.mount('http://', adapter)
+    return scraper
+
+# one cloudscraper session and how well it has been doing. the cloudflare clearance lives in its
+# cookies and is only valid with the user agent that solved the challenge, so both are kept together
+class PooledSession:
+    def __init__(self, scraper, health=1.0, created_at=None, requests=0):
+        self.scraper = scraper
+        self.health = health
+        self.created_at = created_at or time.time()
+        self.requests = requests
+        self.in_flight = 0
+        self.retired = False
+
+    def to_json(self):
+        cookies = [
+            {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'expires': c.expires}
+            for c in self.scraper.cookies
+        ]
+        return {
+            'user_agent': self.scraper.headers.get('User-Agent'),
+            'cookies': cookies,
+            'health': round(self.health, 3),
+            'created_at': self.created_at,
+            'requests': self.requests,
+        }
+
+# small pool of scraper sessions shared by the tracking workers. cookies and user agents are saved
+# between runs so a cleared session is reused instead of solving a new challenge. a session is
+# rotated out on a 403 or once its health drops below SCRAPER_MIN_HEALTH, and callers retry on another
+class ScraperPool:
+    def __init__(self, size=SCRAPER_POOL_SIZE, path=SCRAPER_SESSIONS_FILE, pool_maxsize=1):
+        self.size = max(1, size)
+        self.path = path
+        self.pool_maxsize = pool_maxsize
+        self.lock = threading.Lock()
+        self.stats = {'restored': 0, 'new': 0, 'rotations': 0}
+        self.sessions = self._load()[:self.size]
+        while len(self.sessions) < self.size:
+            self.sessions.append(self._new_session())
+
+    def _new_session(self):
+        self.stats['new'] += 1
+        return PooledSession(new_scraper(self.pool_maxsize))
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return []
+
+        now = time.time()
+        sessions = []
+        for entry in saved:
+            cookies = [c for c in entry.get('cookies', []) if not c.get('expires') or c['expires'] > now]
+            if not cookies or not entry.get('user_agent') or entry.get('health', 1.0) < SCRAPER_MIN_HEALTH:
+                continue
+            scraper = new_scraper(self.pool_maxsize)
+            scraper.headers['User-Agent'] = entry['user_agent']
+            for c in cookies:
+                scraper.cookies.set(c['name'], c['value'], domain=c.get('domain'), path=c.get('path') or '/', expires=c.get('expires'))
+            sessions.append(PooledSession(scraper, entry.get('health', 1.0), entry.get('created_at'), entry.get('requests', 0)))
+            self.stats['restored'] += 1
+        return sessions
+
+    def save(self):
+        with self.lock:
+            saved = [session.to_json() for session in self.sessions]
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"could not save scraper sessions: {e}")
+
+    # healthiest of the least busy sessions, skipping the one a failed request just came from
+    def checkout(self, avoid=None):
+        with self.lock:
+            candidates = [s for s in self.sessions if s is not avoid] or self.sessions
+            session = min(candidates, key=lambda s: (s.in_flight, -s.health))
+            session.in_flight += 1
+            session.requests += 1
+            return session
+
+    # score the request, a 403 or a low score swaps the session for a fresh one
+    def release(self, session, ok, denied=False):
+        with self.lock:
+            session.in_flight -= 1
+            session.health = session.health * HEALTH_DECAY + (1 - HEALTH_DECAY) * (1.0 if ok else 0.0)
+            if session.retired or not (denied or session.health < SCRAPER_MIN_HEALTH):
+                return
+            session.retired = True
+            self.stats['rotations'] += 1
+            reason = "access denied" if denied else f"health {session.health:.2f}"
+            logger.info(f"rotating scraper session after {session.requests} requests: {reason}")
+            self.sessions[self.sessions.index(session)] = self._new_session()
+
+    def health(self):
+        with self.lock:
+            return [round(session.health, 2) for session in self.sessions]
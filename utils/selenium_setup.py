@@ -1,19 +1,98 @@
+import os
+import json
 import logging
+import threading
 import undetected_chromedriver as uc
+from dotenv import load_dotenv
+
+load_dotenv()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
-)
 logger = logging.getLogger(__name__)
 
-def get_driver():
-    logger.info("Initializing undetected Chrome driver...")
+# uc patches the chromedriver binary on launch, so concurrent launches must not overlap
+_launch_lock = threading.Lock()
+
+# lean mode blocks images, fonts, media and third party trackers through CDP
+LEAN_BROWSER = os.getenv('LEAN_BROWSER', '0') == '1'
+CHROME_CACHE_DIR = os.getenv('CHROME_CACHE_DIR') # shared on disk http cache across launches
+
+BLOCKED_EXTENSIONS = [
+    "png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico",
+    "woff", "woff2", "ttf", "otf", "eot",
+    "mp4", "webm", "mp3", "m4a",
+]
+BLOCKED_RESOURCE_PATTERNS = [f"*.{ext}" for ext in BLOCKED_EXTENSIONS] + [f"*.{ext}?*" for ext in BLOCKED_EXTENSIONS]
+BLOCKED_DOMAINS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googleadservices.com",
+    "facebook.net", "connect.facebook.com", "hotjar.com", "clarity.ms", "bat.bing.com",
+    "criteo.com", "criteo.net", "pinterest.com", "tiktok.com", "snapchat.com",
+    "nr-data.net", "newrelic.com", "quantserve.com", "scorecardresearch.com",
+] + [d.strip() for d in os.getenv('BROWSER_BLOCK_DOMAINS', '').split(',') if d.strip()]
+# never blocked by the domain rules. the payment iframes load from adyen
+ALLOWED_DOMAINS = ["adyen.com", "adyenpayments.com"] + [
+    d.strip() for d in os.getenv('BROWSER_ALLOW_DOMAINS', '').split(',') if d.strip()
+]
+
+def blocked_url_patterns():
+    domains = [d for d in BLOCKED_DOMAINS if not any(d == a or d.endswith('.' + a) for a in ALLOWED_DOMAINS)]
+    # scripts, stylesheets, documents and xhr are never matched, so the checkout and payment iframes still run
+    return BLOCKED_RESOURCE_PATTERNS + [f"*://*.{d}/*" for d in domains] + [f"*://{d}/*" for d in domains]
+
+# bytes transferred, blocked requests and page load times, read from chrome's performance log
+class NetworkStats:
+    def __init__(self):
+        self.bytes = 0
+        self.requests = 0
+        self.blocked = 0
+        self.page_loads = []
+        self.main_frame = None
+        self.nav_started = None
+
+    # drain the performance log (it grows until read) and fold it into the totals
+    def collect(self, driver):
+        try:
+            entries = driver.get_log('performance')
+        except Exception as e:
+            logger.debug(f"could not read performance log: {e}")
+            return
+        for entry in entries:
+            message = json.loads(entry['message'])['message']
+            method = message.get('method')
+            params = message.get('params', {})
+            if method == 'Network.loadingFinished':
+                self.requests += 1
+                self.bytes += int(params.get('encodedDataLength', 0))
+            elif method == 'Network.loadingFailed' and params.get('blockedReason'):
+                self.blocked += 1
+            elif method == 'Network.requestWillBeSent' and params.get('type') == 'Document':
+                # the first document request comes from the tab's main frame, its id never changes
+                self.main_frame = self.main_frame or params.get('frameId')
+                if params.get('frameId') == self.main_frame:
+                    self.nav_started = params.get('timestamp')
+            elif method == 'Page.loadEventFired' and self.nav_started is not None:
+                self.page_loads.append(params['timestamp'] - self.nav_started)
+                self.nav_started = None
+
+def get_driver(lean=None):
+    lean = LEAN_BROWSER if lean is None else lean
+    logger.info(f"Initializing undetected Chrome driver{' (lean)' if lean else ''}...")
     options = uc.ChromeOptions()
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-gpu')
     options.add_argument('--disable-dev-shm-usage')
-    
-    driver = uc.Chrome(options=options)
+    if CHROME_CACHE_DIR:
+        os.makedirs(CHROME_CACHE_DIR, exist_ok=True)
+        options.add_argument(f'--disk-cache-dir={os.path.abspath(CHROME_CACHE_DIR)}')
+    if lean:
+        options.add_argument('--blink-settings=imagesEnabled=false')
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+    with _launch_lock:
+        driver = uc.Chrome(options=options)
+
+    if lean:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_url_patterns()})
+    driver.network_stats = NetworkStats()
     logger.info("Undetected Chrome driver initialized successfully.")
-    return driver
\ No newline at end of file
+    return driver
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import logging
+from dotenv import load_dotenv
+from utils.step_timing import step_timer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+SHEET_MIRROR_DB = os.path.join(STATE_DIR, 'sheet_mirror.db')
+
+# local indexed copy of the "fnet tracking" sheet (A: PO_num, B: fnet order number, C: carrier, D: tracking).
+# synced by delta: only rows after the last known row are fetched, rows we write are recorded directly
+class SheetMirror:
+    def __init__(self, path=SHEET_MIRROR_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " sheet_row INTEGER PRIMARY KEY, po_num TEXT, fnet_num TEXT, carrier TEXT, tracking TEXT);"
+            "CREATE INDEX IF NOT EXISTS rows_po_num ON rows (po_num);"
+            "CREATE INDEX IF NOT EXISTS rows_fnet_num ON rows (fnet_num);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        self.conn.commit()
+
+    def last_row(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_row'").fetchone()
+        return int(row[0]) if row else None
+
+    def next_free_row(self):
+        return (self.last_row() or 1) + 1
+
+    # fetch rows added to the sheet since the last sync, the first sync reads the whole sheet once
+    @step_timer.timed('sheets.read')
+    def sync(self, sheet):
+        last_row = self.last_row()
+        if last_row is None:
+            rows = sheet.get_all_values()[1:]
+            start_row = 2
+            logger.info(f"building sheet mirror from {len(rows)} rows")
+        else:
+            start_row = last_row + 1
+            rows = sheet.get(f"A{start_row}:D")
+        self._store(start_row, rows)
+        return len(rows)
+
+    # drop everything and read the whole sheet again, for when rows were inserted, deleted or
+    # sorted by hand and the stored row numbers no longer line up
+    def rebuild(self, sheet):
+        self.conn.execute("DELETE FROM rows")
+        self.conn.execute("DELETE FROM meta WHERE key = 'last_row'")
+        self.conn.commit()
+        return self.sync(sheet)
+
+    # record rows we appended ourselves so the next sync doesn't fetch them again
+    def record_written(self, start_row, rows):
+        self._store(start_row, rows)
+
+    def record_update(self, sheet_row, carrier, tracking):
+        self.conn.execute("UPDATE rows SET carrier = ?, tracking = ? WHERE sheet_row = ?", (carrier, tracking, sheet_row))
+        self.conn.commit()
+
+    def row_for_po(self, po_num):
+        row = self.conn.execute("SELECT sheet_row FROM rows WHERE po_num = ? LIMIT 1", (po_num,)).fetchone()
+        return row[0] if row else None
+
+    def row_for_fnet(self, fnet_num):
+        row = self.conn.execute("SELECT sheet_row FROM rows WHERE fnet_num = ? LIMIT 1", (fnet_num,)).fetchone()
+        return row[0] if row else None
+
+    # (sheet_row, fnet_num, has_tracking) for rows after the given row
+    def rows_after(self, sheet_row):
+        return [
+            (row, fnet_num, bool(tracking))
+            for row, fnet_num, tracking in self.conn.execute(
+                "SELECT sheet_row, fnet_num, tracking FROM rows WHERE sheet_row > ? AND fnet_num != '' ORDER BY sheet_row",
+                (sheet_row,),
+            )
+        ]
+
+    def _store(self, start_row, rows):
+        for i, row in enumerate(rows, start=start_row):
+            cells = [cell.strip() for cell in row] + [''] * (4 - len(row))
+            if not any(cells[:4]):
+                continue
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rows (sheet_row, po_num, fnet_num, carrier, tracking) VALUES (?, ?, ?, ?, ?)",
+                (i, *cells[:4]),
+            )
+        end_row = start_row + len(rows) - 1
+        if end_row > (self.last_row() or 0) or self.last_row() is None:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_row', ?)", (str(max(end_row, 1)),))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
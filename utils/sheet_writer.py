@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import time
+import logging
+from dotenv import load_dotenv
+from utils.rate_limit import TokenBucket
+from utils.step_timing import step_timer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+SHEET_SPOOL_FILE = os.path.join(STATE_DIR, 'sheet_spool.jsonl')
+
+# sheets allows 60 write requests per minute per user, stay under it
+SHEETS_WRITES_PER_MINUTE = float(os.getenv('SHEETS_WRITES_PER_MINUTE', '50'))
+SHEETS_WRITE_BURST = 5
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 5 # seconds, doubled on each retry
+MAX_RANGES_PER_CALL = 500
+
+RANGE_RE = re.compile(r"^([A-Z]+)(\d+):([A-Z]+)(\d+)$")
+
+write_bucket = TokenBucket(SHEETS_WRITES_PER_MINUTE / 60, capacity=SHEETS_WRITE_BURST)
+
+# collapse updates to consecutive rows over the same columns (C5:D5 + C6:D6 -> C5:D6)
+def merge_ranges(updates):
+    parsed = []
+    passthrough = []
+    for cell_range, values in updates.items():
+        match = RANGE_RE.match(cell_range)
+        if match and int(match.group(4)) - int(match.group(2)) + 1 == len(values):
+            parsed.append((match.group(1), match.group(3), int(match.group(2)), int(match.group(4)), values))
+        else:
+            passthrough.append({'range': cell_range, 'values': values})
+
+    merged = []
+    for first_col, last_col, start, end, values in sorted(parsed, key=lambda p: (p[0], p[1], p[2])):
+        prev = merged[-1] if merged else None
+        if prev and prev[0] == first_col and prev[1] == last_col and prev[3] + 1 == start:
+            prev[3] = end
+            prev[4] = prev[4] + values
+        else:
+            merged.append([first_col, last_col, start, end, values])
+
+    return [{'range': f"{a}{start}:{b}{end}", 'values': values} for a, b, start, end, values in merged] + passthrough
+
+# True if cell_range lies inside other (C6:D6 in C5:D7), ranges that aren't row blocks only match themselves
+def range_within(cell_range, other):
+    inner, outer = RANGE_RE.match(cell_range), RANGE_RE.match(other)
+    if not inner or not outer:
+        return cell_range == other
+    return (inner.group(1), inner.group(3)) == (outer.group(1), outer.group(3)) and \
+        int(outer.group(2)) <= int(inner.group(2)) and int(inner.group(4)) <= int(outer.group(4))
+
+# single write-behind queue for every sheet write. appends use the append api (no full read),
+# range updates are merged into one values_batch_update, calls are paced by a token bucket,
+# and anything that still fails is spooled to disk and replayed by the next writer
+class SheetWriter:
+    def __init__(self, sheet, spool_file=SHEET_SPOOL_FILE):
+        self.sheet = sheet
+        self.spool_file = spool_file
+        self.appends = []
+        self.updates = {}
+        self.written_ranges = set() # update ranges the last flush got into the sheet
+        self._load_spool()
+
+    def append_rows(self, rows):
+        self.appends.extend(rows)
+
+    def update(self, cell_range, values):
+        self.updates[cell_range] = values
+
+    # write everything queued. returns (first_row, rows) for the appended block, or None.
+    # updates that were spooled instead of written are left out of written_ranges
+    def flush(self):
+        appended = None
+        failed = []
+        self.written_ranges = set()
+
+        if self.appends:
+            rows, self.appends = self.appends, []
+            response = self._call(lambda: self.sheet.append_rows(rows, value_input_option='RAW', table_range='A1'))
+            if response is None:
+                failed.append({'op': 'append', 'rows': rows})
+            else:
+                appended = (appended_start_row(response), rows)
+                logger.info(f"appended {len(rows)} rows to sheet")
+
+        if self.updates:
+            queued = list(self.updates)
+            data, self.updates = merge_ranges(self.updates), {}
+            failed_ranges = []
+            for i in range(0, len(data), MAX_RANGES_PER_CALL):
+                chunk = data[i:i + MAX_RANGES_PER_CALL]
+                body = {
+                    'valueInputOption': 'RAW',
+                    'data': [{'range': f"'{self.sheet.title}'!{d['range']}", 'values': d['values']} for d in chunk],
+                }
+                if self._call(lambda: self.sheet.spreadsheet.values_batch_update(body)) is None:
+                    failed.extend({'op': 'update', 'range': d['range'], 'values': d['values']} for d in chunk)
+                    failed_ranges.extend(d['range'] for d in chunk)
+                else:
+                    logger.info(f"updated {len(chunk)} sheet ranges in one batch")
+            self.written_ranges = {r for r in queued if not any(range_within(r, f) for f in failed_ranges)}
+
+        self._write_spool(failed)
+        return appended
+
+    def _call(self, request):
+        for attempt in range(MAX_ATTEMPTS):
+            write_bucket.acquire()
+            try:
+                with step_timer.span('sheets.write'):
+                    return request()
+            except Exception as e:
+                logger.warning(f"sheet write attempt {attempt + 1} of {MAX_ATTEMPTS} failed: {e}")
+                if attempt + 1 < MAX_ATTEMPTS:
+                    time.sleep(RETRY_DELAY * 2 ** attempt)
+        return None
+
+    def _load_spool(self):
+        try:
+            with open(self.spool_file) as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return
+        for entry in entries:
+            if entry['op'] == 'append':
+                self.appends.extend(entry['rows'])
+            else:
+                self.updates[entry['range']] = entry['values']
+        if entries:
+            logger.info(f"replaying {len(entries)} spooled sheet writes")
+
+    def _write_spool(self, entries):
+        if not entries:
+            if os.path.exists(self.spool_file):
+                os.remove(self.spool_file)
+            return
+        os.makedirs(os.path.dirname(self.spool_file) or '.', exist_ok=True)
+        tmp_file = f"{self.spool_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp_file, self.spool_file)
+        logger.error(f"spooled {len(entries)} failed sheet writes to {self.spool_file}")
+
+# first row number of an append response, e.g. updatedRange "'fnet tracking'!A12:B14" -> 12
+def appended_start_row(response):
+    updated_range = response.get('updates', {}).get('updatedRange', '')
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
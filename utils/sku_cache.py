@@ -0,0 +1,95 @@
+import os
+import time
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+SKU_CACHE_DB = os.path.join(STATE_DIR, 'sku_cache.db')
+SKU_CACHE_TTL_HOURS = float(os.getenv('SKU_CACHE_TTL_HOURS', '72'))
+SKU_AVAILABILITY_TTL_MINUTES = float(os.getenv('SKU_AVAILABILITY_TTL_MINUTES', '30')) # stock changes, keep this short
+
+# on disk sku -> product page url / item id, shared by every worker, plus short lived pre-flight availability
+class SkuCache:
+    def __init__(self, path=SKU_CACHE_DB, ttl_hours=SKU_CACHE_TTL_HOURS, availability_ttl_minutes=SKU_AVAILABILITY_TTL_MINUTES):
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.availability_ttl = availability_ttl_minutes * 60
+        self.lock = threading.Lock()
+        self.conn = None
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _db(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS skus ("
+                "sku TEXT PRIMARY KEY, url TEXT NOT NULL, product_id TEXT, cached_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS availability ("
+                "sku TEXT PRIMARY KEY, status TEXT NOT NULL, reason TEXT, checked_at REAL NOT NULL)"
+            )
+        return self.conn
+
+    # returns {'url', 'product_id'} for a fresh entry, otherwise None. count=False keeps the lookup out of the stats
+    def get(self, sku, count=True):
+        with self.lock:
+            row = self._db().execute(
+                "SELECT url, product_id, cached_at FROM skus WHERE sku = ?", (sku,)
+            ).fetchone()
+            hit = row is not None and time.time() - row[2] <= self.ttl
+            if count:
+                self.stats['hits' if hit else 'misses'] += 1
+            return {'url': row[0], 'product_id': row[1]} if hit else None
+
+    def put(self, sku, url, product_id=None):
+        with self.lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO skus (sku, url, product_id, cached_at) VALUES (?, ?, ?, ?)",
+                (sku, url, product_id, time.time()),
+            )
+            db.commit()
+
+    # drop an entry whose page no longer matches the sku
+    def invalidate(self, sku):
+        with self.lock:
+            db = self._db()
+            db.execute("DELETE FROM skus WHERE sku = ?", (sku,))
+            db.commit()
+            self.stats['invalidations'] += 1
+
+    # (status, reason) from a recent pre-flight check, or None
+    def get_availability(self, sku):
+        with self.lock:
+            row = self._db().execute(
+                "SELECT status, reason, checked_at FROM availability WHERE sku = ?", (sku,)
+            ).fetchone()
+            if row is None or time.time() - row[2] > self.availability_ttl:
+                return None
+            return row[0], row[1]
+
+    def put_availability(self, sku, status, reason=None):
+        with self.lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO availability (sku, status, reason, checked_at) VALUES (?, ?, ?, ?)",
+                (sku, status, reason, time.time()),
+            )
+            db.commit()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+sku_cache = SkuCache()
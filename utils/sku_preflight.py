@@ -0,0 +1,169 @@
+import os
+import re
+import logging
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils.rate_limit import TokenBucket
+from utils.sku_cache import sku_cache
+from utils.scraper_pool import new_scraper
+from utils.step_timing import step_timer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# every distinct sku in the run is checked over http before any browser starts
+SKU_PREFLIGHT = os.getenv('SKU_PREFLIGHT', '1') == '1'
+SKU_PREFLIGHT_WORKERS = int(os.getenv('SKU_PREFLIGHT_WORKERS', '8'))
+SKU_PREFLIGHT_REQUESTS_PER_SECOND = float(os.getenv('SKU_PREFLIGHT_REQUESTS_PER_SECOND', '5'))
+HTTP_TIMEOUT = 20
+
+AVAILABLE = 'available'
+UNAVAILABLE = 'unavailable' # the PO fails fast
+UNKNOWN = 'unknown' # check failed, the PO goes through checkout as usual
+
+ADD_BUTTON_RE = re.compile(r"<[^>]*\bid=[\"']addBagButton[\"'][^>]*>", re.I)
+OUT_OF_STOCK_RE = re.compile(r"out of stock|sold out|currently unavailable", re.I)
+NO_RESULTS_RE = re.compile(r"no results|no products (were )?found|did not match any", re.I)
+
+stats = {'checked': 0, 'cached': 0, 'unavailable': 0, 'unknown': 0}
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
+
+# anonymous session, never logged in
+def preflight_session():
+    return new_scraper(SKU_PREFLIGHT_WORKERS)
+
+# (action url, method, field name) of the site search form on the home page, or None
+def search_form(session, home_url):
+    from bs4 import BeautifulSoup
+
+    response = session.get(home_url, timeout=HTTP_TIMEOUT)
+    search_input = BeautifulSoup(response.text, 'html.parser').find(id='searchInput')
+    form = search_input.find_parent('form') if search_input else None
+    if form is None or not search_input.get('name'):
+        return None
+    return urljoin(response.url, form.get('action') or response.url), (form.get('method') or 'get').lower(), search_input['name']
+
+# reason a response says nothing about the sku (blocked, server error, login wall), or None
+def blocked_reason(response):
+    if response.status_code == 403 or response.status_code >= 500:
+        return f"HTTP {response.status_code}"
+    if 'name="mv_username"' in response.text:
+        return "site asked for a login"
+    return None
+
+# (status, reason) for a product page response. only pages we recognise as no results or out of
+# stock count as unavailable, anything else without a product (maintenance, interstitials) is unknown
+def page_availability(response):
+    blocked = blocked_reason(response)
+    if blocked:
+        return UNKNOWN, blocked
+    text = response.text
+    if 'id="brandTitle"' not in text:
+        if NO_RESULTS_RE.search(text):
+            return UNAVAILABLE, "not found on the site"
+        return UNKNOWN, f"unrecognised page (HTTP {response.status_code})"
+    button = ADD_BUTTON_RE.search(text)
+    if button is None or 'disabled' in button.group(0).lower():
+        # the session isn't logged in, a missing button alone may just be hidden from guests
+        if OUT_OF_STOCK_RE.search(text):
+            return UNAVAILABLE, "out of stock"
+        return UNKNOWN, "no add to cart button"
+    return AVAILABLE, None
+
+# same check as checkout's open_cached_product: the item code when both are known, otherwise the sku on the page
+def page_matches(text, sku, cached_product_id):
+    from utils.http_cart import item_code
+
+    if 'id="brandTitle"' not in text:
+        return False
+    item = item_code(text)
+    return item == cached_product_id if item and cached_product_id else sku in text
+
+# product page response for a sku, straight from the cached url when it still shows that sku, otherwise
+# through search. returns (response, status, reason), response is None when the request itself failed
+def fetch_product_page(session, search, rate_limiter, sku):
+    from utils.http_cart import item_code
+
+    try:
+        cached = sku_cache.get(sku, count=False)
+        if cached:
+            rate_limiter.acquire()
+            response = session.get(cached['url'], timeout=HTTP_TIMEOUT)
+            if not blocked_reason(response) and not page_matches(response.text, sku, cached['product_id']):
+                logger.info(f"cached page for sku {sku} no longer matches, falling back to search")
+                sku_cache.invalidate(sku)
+                cached = None
+        if not cached:
+            action, method, field = search
+            rate_limiter.acquire()
+            if method == 'post':
+                response = session.post(action, data={field: sku}, timeout=HTTP_TIMEOUT)
+            else:
+                response = session.get(action, params={field: sku}, timeout=HTTP_TIMEOUT)
+    except Exception as e:
+        return None, UNKNOWN, f"request failed: {e}"
+
+    status, reason = page_availability(response)
+    if status == AVAILABLE and not cached:
+        sku_cache.put(sku, response.url, item_code(response.text)) # checkout can open the page directly
+    return response, status, reason
+
+def check_sku(session, search, rate_limiter, sku):
+    _, status, reason = fetch_product_page(session, search, rate_limiter, sku)
+    return status, reason
+
+# check skus concurrently, returns {sku: (status, reason)}. results are cached for SKU_AVAILABILITY_TTL_MINUTES
+def preflight_skus(skus, home_url):
+    results = {}
+    if not SKU_PREFLIGHT or not skus:
+        return results
+
+    to_check = []
+    for sku in sorted(skus):
+        cached = sku_cache.get_availability(sku)
+        if cached:
+            results[sku] = cached
+            stats['cached'] += 1
+        else:
+            to_check.append(sku)
+
+    if to_check:
+        with step_timer.span('preflight') as span:
+            try:
+                session = preflight_session()
+                search = search_form(session, home_url)
+            except Exception as e:
+                search = None
+                logger.warning(f"sku pre-flight skipped, could not load the search form: {e}")
+            if search is None:
+                span['ok'] = False
+                return results
+
+            rate_limiter = TokenBucket(SKU_PREFLIGHT_REQUESTS_PER_SECOND, capacity=max(1, SKU_PREFLIGHT_WORKERS))
+            with ThreadPoolExecutor(max_workers=max(1, SKU_PREFLIGHT_WORKERS)) as executor:
+                checked = executor.map(lambda sku: check_sku(session, search, rate_limiter, sku), to_check)
+                for sku, (status, reason) in zip(to_check, checked):
+                    results[sku] = (status, reason)
+                    stats['checked'] += 1
+                    if status == UNKNOWN:
+                        stats['unknown'] += 1
+                        logger.info(f"sku {sku} pre-flight inconclusive: {reason}")
+                    else:
+                        sku_cache.put_availability(sku, status, reason)
+
+    stats['unavailable'] += sum(1 for status, _ in results.values() if status == UNAVAILABLE)
+    return results
+
+# reason a PO can't be fulfilled, or None
+def unavailable_reason(order, availability):
+    reasons = [
+        f"sku {item['sku']} {availability[item['sku']][1]}"
+        for item in order['items']
+        if availability.get(item['sku'], (UNKNOWN, None))[0] == UNAVAILABLE
+    ]
+    return '; '.join(reasons) or None
@@ -0,0 +1,31 @@
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+STARTUP_TIMING_FILE = os.path.join(STATE_DIR, 'startup_timing.jsonl')
+
+# milliseconds from process start (this module is the first thing main.py imports) to named points in a run
+class StartupTimer:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, name):
+        self.marks.setdefault(name, round((time.perf_counter() - self.started_at) * 1000, 1))
+
+    # print the timings and append them to STATE_DIR/startup_timing.jsonl to track regressions
+    def report(self, command):
+        self.mark('total')
+        logger.info(f"startup timing ({command}): " + ', '.join(f"{name} {ms} ms" for name, ms in self.marks.items()))
+        try:
+            os.makedirs(STATE_DIR, exist_ok=True)
+            with open(STARTUP_TIMING_FILE, 'a') as f:
+                f.write(json.dumps({'ts': time.time(), 'command': command, **self.marks}) + '\n')
+        except OSError as e:
+            logger.warning(f"could not save startup timing: {e}")
+
+startup = StartupTimer()
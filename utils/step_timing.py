@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+STEP_TIMING_DIR = os.path.join(STATE_DIR, 'step_timings') # one jsonl file of spans per run
+METRICS_TEXTFILE_DIR = os.getenv('METRICS_TEXTFILE_DIR', STATE_DIR) # point node_exporter's textfile collector here
+STEP_TIMING_KEEP_RUNS = 200
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[int(q * (len(samples) - 1))]
+
+# steps run one after another, each next() closes the running step and starts the next.
+# used as a context manager so the step that raised is recorded as failed
+class Laps:
+    def __init__(self, timer, prefix, fields):
+        self.timer = timer
+        self.prefix = prefix
+        self.fields = fields
+        self.step = None
+        self.started = None
+
+    def next(self, step):
+        self.end()
+        self.step = step
+        self.started = time.perf_counter()
+
+    def end(self, ok=True):
+        if self.step is not None:
+            self.timer.record(f"{self.prefix}.{self.step}", time.perf_counter() - self.started, ok, **self.fields)
+            self.step = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(ok=exc_type is None)
+
+# timing spans for one run (an order run or a tracking run), written to STATE_DIR/step_timings as jsonl
+# and to a prometheus textfile with p50/p95 per step and the run's orders per hour
+class StepTimer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_run('idle')
+
+    def start_run(self, kind):
+        with self.lock:
+            self.kind = kind
+            self.run_started = time.time()
+            self.spans = []
+
+    def record(self, step, seconds, ok=True, **fields):
+        with self.lock:
+            self.spans.append({'ts': time.time(), 'step': step, 'seconds': round(seconds, 4), 'ok': ok, **fields})
+
+    # time a block, span['ok'] can be set to False for calls that report failure without raising
+    @contextmanager
+    def span(self, step, **fields):
+        span = {'ok': True}
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception:
+            span['ok'] = False
+            raise
+        finally:
+            self.record(step, time.perf_counter() - started, span['ok'], **fields)
+
+    def laps(self, prefix, **fields):
+        return Laps(self, prefix, fields)
+
+    # decorator form of span
+    def timed(self, step):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(step):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self, orders=None):
+        with self.lock:
+            spans = list(self.spans)
+        run_seconds = time.time() - self.run_started
+        steps = {}
+        for span in spans:
+            steps.setdefault(span['step'], []).append(span)
+        summary = {
+            'kind': self.kind,
+            'run_seconds': round(run_seconds, 1),
+            'steps': {
+                step: {
+                    'count': len(entries),
+                    'errors': sum(1 for e in entries if not e['ok']),
+                    'total': round(sum(e['seconds'] for e in entries), 3),
+                    'p50': round(percentile([e['seconds'] for e in entries], 0.5), 3),
+                    'p95': round(percentile([e['seconds'] for e in entries], 0.95), 3),
+                }
+                for step, entries in sorted(steps.items())
+            },
+        }
+        if orders is not None:
+            summary['orders'] = orders
+            summary['orders_per_hour'] = round(orders * 3600 / run_seconds, 1) if run_seconds > 0 else 0
+        return summary, spans
+
+    # write this run's spans and summary, then start collecting for the next run. returns the summary
+    def report(self, orders=None):
+        summary, spans = self.summary(orders)
+        try:
+            self._write_jsonl(summary, spans)
+            self._write_textfile(summary)
+        except OSError as e:
+            logger.warning(f"could not save step timings: {e}")
+        self.start_run('idle')
+        return summary
+
+    def _write_jsonl(self, summary, spans):
+        os.makedirs(STEP_TIMING_DIR, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.run_started))
+        with open(os.path.join(STEP_TIMING_DIR, f"{summary['kind']}-{stamp}.jsonl"), 'w') as f:
+            for span in spans:
+                f.write(json.dumps(span) + '\n')
+            f.write(json.dumps({'summary': summary}) + '\n')
+
+        runs = sorted(os.listdir(STEP_TIMING_DIR), key=lambda name: os.path.getmtime(os.path.join(STEP_TIMING_DIR, name)))
+        for name in runs[:-STEP_TIMING_KEEP_RUNS]:
+            os.remove(os.path.join(STEP_TIMING_DIR, name))
+
+    # one file per run kind so an order run and a tracking run don't overwrite each other
+    def _write_textfile(self, summary):
+        kind = summary['kind']
+        lines = [
+            '# HELP fnetbot_step_seconds duration of each step in the last run',
+            '# TYPE fnetbot_step_seconds summary',
+        ]
+        for step, stats in summary['steps'].items():
+            labels = f'kind="{kind}",step="{step}"'
+            lines.append(f'fnetbot_step_seconds{{{labels},quantile="0.5"}} {stats["p50"]}')
+            lines.append(f'fnetbot_step_seconds{{{labels},quantile="0.95"}} {stats["p95"]}')
+            lines.append(f'fnetbot_step_seconds_sum{{{labels}}} {stats["total"]}')
+            lines.append(f'fnetbot_step_seconds_count{{{labels}}} {stats["count"]}')
+        lines.append('# TYPE fnetbot_step_errors gauge')
+        for step, stats in summary['steps'].items():
+            lines.append(f'fnetbot_step_errors{{kind="{kind}",step="{step}"}} {stats["errors"]}')
+        lines.append('# TYPE fnetbot_run_seconds gauge')
+        lines.append(f'fnetbot_run_seconds{{kind="{kind}"}} {summary["run_seconds"]}')
+        lines.append('# TYPE fnetbot_last_run_timestamp_seconds gauge')
+        lines.append(f'fnetbot_last_run_timestamp_seconds{{kind="{kind}"}} {round(time.time())}')
+        if 'orders_per_hour' in summary:
+            lines.append('# TYPE fnetbot_orders_per_hour gauge')
+            lines.append(f'fnetbot_orders_per_hour {summary["orders_per_hour"]}')
+
+        # write then rename, the collector must never read a half written file
+        os.makedirs(METRICS_TEXTFILE_DIR, exist_ok=True)
+        path = os.path.join(METRICS_TEXTFILE_DIR, f"fnetbot_{kind}.prom")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+# the slowest steps by p95, for the summary email
+def slowest_steps(summary, count=5):
+    steps = sorted(summary['steps'].items(), key=lambda item: item[1]['p95'], reverse=True)[:count]
+    return ', '.join(f"{step} p50 {s['p50']} s / p95 {s['p95']} s" for step, s in steps) or "None"
+
+step_timer = StepTimer()
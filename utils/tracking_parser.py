@@ -0,0 +1,64 @@
+import os
+import re
+import html
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACKING_PARSER = os.getenv('TRACKING_PARSER', 'fast') # fast = targeted scan, soup = full BeautifulSoup tree
+
+VENDOR_MARKER = "Shipment Vendor"
+TRACKING_MARKER = "Shipment Tracking"
+VENDOR_RE = re.compile(r"<strong[^>]*>[^<]*Shipment Vendor[^<]*</strong>([^<]*)", re.I)
+LINK_RE = re.compile(r"<a\b[^>]*>(.*?)</a>", re.I | re.S)
+TAG_RE = re.compile(r"<[^>]+>")
+STRONG_OPEN_RE = re.compile(r"<strong[^>]*>[^<]*$", re.I)
+
+def _text(fragment):
+    return html.unescape(TAG_RE.sub("", fragment)).strip()
+
+# scans straight to the two markers and stops once the fields are found.
+# returns None when a marker is on the page but the layout isn't the one we expect
+def parse_tracking_fast(page):
+    vendor_at = page.find(VENDOR_MARKER)
+    tracking_at = page.find(TRACKING_MARKER)
+
+    shipment_vendor = "Unknown"
+    if vendor_at != -1:
+        match = VENDOR_RE.search(page, max(0, page.rfind("<strong", 0, vendor_at)))
+        if not match:
+            return None
+        shipment_vendor = _text(match.group(1))
+
+    tracking_number = None
+    if tracking_at != -1:
+        strong_at = page.rfind("<strong", 0, tracking_at)
+        end_at = page.find("</strong>", tracking_at)
+        if strong_at == -1 or end_at == -1 or not STRONG_OPEN_RE.search(page, strong_at, tracking_at):
+            return None
+        match = LINK_RE.search(page, end_at)
+        if not match:
+            return None
+        tracking_number = _text(match.group(1))
+
+    return shipment_vendor, tracking_number
+
+# original full tree parse, kept as the fallback
+def parse_tracking_soup(page):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, 'html.parser')
+    vendor_tag = soup.find("strong", string=re.compile(r"Shipment Vendor"))
+    shipment_vendor = vendor_tag.next_sibling.strip() if vendor_tag else "Unknown"
+
+    tracking_tag = soup.find("strong", string=re.compile(r"Shipment Tracking"))
+    tracking_number = tracking_tag.find_next("a").text.strip() if tracking_tag else None
+
+    return shipment_vendor, tracking_number
+
+def parse_tracking_page(page, parser=TRACKING_PARSER):
+    if parser == 'fast':
+        result = parse_tracking_fast(page)
+        if result is not None:
+            return result
+    return parse_tracking_soup(page)
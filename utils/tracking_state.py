@@ -0,0 +1,115 @@
+import os
+import time
+import sqlite3
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+TRACKING_STATE_DB = os.path.join(STATE_DIR, 'tracking_state.db')
+
+# re-check schedule: nothing for the first N hours, then exponential backoff until the give up threshold
+TRACKING_FIRST_CHECK_HOURS = float(os.getenv('TRACKING_FIRST_CHECK_HOURS', '12'))
+TRACKING_BACKOFF_HOURS = float(os.getenv('TRACKING_BACKOFF_HOURS', '2'))
+TRACKING_MAX_INTERVAL_HOURS = float(os.getenv('TRACKING_MAX_INTERVAL_HOURS', '48'))
+TRACKING_MAX_ATTEMPTS = int(os.getenv('TRACKING_MAX_ATTEMPTS', '20'))
+
+# local record of order number -> sheet row, checks and status so a run only scrapes orders that are due
+class TrackingState:
+    def __init__(self, path=TRACKING_STATE_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            "order_number TEXT PRIMARY KEY, sheet_row INTEGER NOT NULL, first_seen REAL NOT NULL,"
+            "last_checked REAL, attempts INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL DEFAULT 'pending')"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def last_row(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_row'").fetchone()
+        return int(row[0]) if row else None
+
+    # pull in orders the sheet mirror has seen since the last sync
+    def sync(self, mirror):
+        now = time.time()
+        last_row = self.last_row()
+        if last_row is None:
+            # rows from before the store existed are old enough to check right away
+            first_seen = now - TRACKING_FIRST_CHECK_HOURS * 3600
+            rows = mirror.rows_after(0)
+            logger.info(f"bootstrapping tracking state from {len(rows)} mirrored sheet rows")
+        else:
+            first_seen = now
+            rows = mirror.rows_after(last_row)
+
+        for sheet_row, order_number, has_tracking in rows:
+            status = 'found' if has_tracking else 'pending'
+            self.conn.execute(
+                "INSERT OR IGNORE INTO orders (order_number, sheet_row, first_seen, status) VALUES (?, ?, ?, ?)",
+                (order_number, sheet_row, first_seen, status),
+            )
+
+        new_last_row = rows[-1][0] if rows else (last_row or 0)
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_row', ?)", (str(new_last_row),))
+        self.conn.commit()
+        return len(rows)
+
+    # after the mirror was rebuilt: move known orders to their current rows, add any new ones and
+    # close pending orders whose row was deleted from the sheet, so they aren't checked again
+    def resync_rows(self, mirror):
+        now = time.time()
+        rows = mirror.rows_after(0)
+        in_sheet = {order_number for _, order_number, _ in rows}
+        for (order_number,) in self.conn.execute("SELECT order_number FROM orders WHERE status = 'pending'").fetchall():
+            if order_number not in in_sheet:
+                logger.warning(f"order {order_number} was removed from the sheet, no longer checking its tracking")
+                self.conn.execute("UPDATE orders SET status = 'removed' WHERE order_number = ?", (order_number,))
+        for sheet_row, order_number, has_tracking in rows:
+            self.conn.execute("UPDATE orders SET sheet_row = ? WHERE order_number = ?", (sheet_row, order_number))
+            self.conn.execute(
+                "INSERT OR IGNORE INTO orders (order_number, sheet_row, first_seen, status) VALUES (?, ?, ?, ?)",
+                (order_number, sheet_row, now, 'found' if has_tracking else 'pending'),
+            )
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_row', ?)", (str(rows[-1][0] if rows else 0),))
+        self.conn.commit()
+
+    # (sheet_row, order_number) for pending orders whose next check time has passed
+    def due_orders(self):
+        now = time.time()
+        due = []
+        rows = self.conn.execute(
+            "SELECT order_number, sheet_row, first_seen, last_checked, attempts FROM orders WHERE status = 'pending' ORDER BY sheet_row"
+        )
+        for order_number, sheet_row, first_seen, last_checked, attempts in rows:
+            if now < first_seen + TRACKING_FIRST_CHECK_HOURS * 3600:
+                continue
+            if attempts:
+                interval = min(TRACKING_BACKOFF_HOURS * 2 ** (attempts - 1), TRACKING_MAX_INTERVAL_HOURS)
+                if now < last_checked + interval * 3600:
+                    continue
+            due.append((sheet_row, order_number))
+        return due
+
+    def record_check(self, order_number, found):
+        row = self.conn.execute("SELECT attempts FROM orders WHERE order_number = ?", (order_number,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        if found:
+            status = 'found'
+        elif attempts >= TRACKING_MAX_ATTEMPTS:
+            status = 'gave_up'
+            logger.warning(f"giving up on tracking for order {order_number} after {attempts} attempts")
+        else:
+            status = 'pending'
+        self.conn.execute(
+            "UPDATE orders SET last_checked = ?, attempts = ?, status = ? WHERE order_number = ?",
+            (time.time(), attempts, status, order_number),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+WAIT_MODE = os.getenv('WAIT_MODE', 'adaptive') # adaptive = wait on page signals, conservative = the old fixed sleeps
+LATENCY_FILE = os.path.join(STATE_DIR, 'step_latencies.json')
+
+IDLE_WINDOW = 0.5 # seconds with no new network requests before the page counts as idle
+POLL_INTERVAL = 0.1
+MIN_TIMEOUT = 1.0 # learned timeouts never drop below this
+TIMEOUT_HEADROOM = 2.0 # learned timeout = p95 latency * headroom
+MIN_SAMPLES = 5
+WINDOW = 100 # latencies kept per step
+
+# observed per-step latencies, shared by every worker and persisted between runs
+class LatencyModel:
+    def __init__(self, path=LATENCY_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.samples = json.load(f)
+        except (OSError, ValueError):
+            self.samples = {}
+
+    def record(self, step, seconds):
+        with self.lock:
+            samples = self.samples.setdefault(step, [])
+            samples.append(round(seconds, 3))
+            del samples[:-WINDOW]
+
+    def timeout(self, step, default):
+        with self.lock:
+            samples = sorted(self.samples.get(step, []))
+        if len(samples) < MIN_SAMPLES:
+            return default
+        p95 = samples[int(0.95 * (len(samples) - 1))]
+        return min(default, max(MIN_TIMEOUT, p95 * TIMEOUT_HEADROOM))
+
+    def save(self):
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'w') as f:
+                    json.dump(self.samples, f)
+            except OSError as e:
+                logger.warning(f"could not save step latencies: {e}")
+
+latency_model = LatencyModel()
+
+# document loaded, no pending jquery ajax and no new network requests for IDLE_WINDOW seconds
+class page_settled:
+    def __init__(self):
+        self.resource_count = None
+        self.idle_since = None
+
+    def __call__(self, driver):
+        state, active, resource_count = driver.execute_script(
+            "return [document.readyState,"
+            " window.jQuery ? window.jQuery.active : 0,"
+            " performance.getEntriesByType('resource').length];"
+        )
+        now = time.monotonic()
+        if state != 'complete' or active or resource_count != self.resource_count:
+            self.resource_count = resource_count
+            self.idle_since = now
+            return False
+        return now - self.idle_since >= IDLE_WINDOW
+
+# every (iframe, field_id) pair has loaded its input field
+class iframes_ready:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def __call__(self, driver):
+        try:
+            for frame, field_id in self.frames:
+                driver.switch_to.frame(frame)
+                found = driver.find_elements(By.ID, field_id)
+                driver.switch_to.default_content()
+                if not found:
+                    return False
+            return True
+        except WebDriverException:
+            driver.switch_to.default_content()
+            return False
+
+class WaitPolicy:
+    def __init__(self, driver, mode=WAIT_MODE, model=latency_model):
+        self.driver = driver
+        self.mode = mode
+        self.model = model
+
+    # stand in for a fixed time.sleep(seconds): conservative mode sleeps, adaptive mode
+    # waits for the ready condition (page settled by default) up to the learned timeout, never
+    # longer than the old sleep. only waits that saw the page get ready are learned from, so a
+    # page that never settles can't push the timeouts up
+    def pause(self, step, seconds, ready=None):
+        if self.mode == 'conservative':
+            time.sleep(seconds)
+            return
+
+        condition = ready or page_settled()
+        timeout = self.model.timeout(step, seconds)
+        start = time.monotonic()
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=POLL_INTERVAL).until(condition)
+        except TimeoutException:
+            logger.info(f"step {step} not ready after {timeout:.1f}s, continuing")
+            return
+        except WebDriverException as e:
+            logger.info(f"step {step} readiness check failed ({e}), falling back to fixed wait")
+            time.sleep(seconds)
+            return
+        self.model.record(step, time.monotonic() - start)
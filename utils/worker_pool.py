@@ -0,0 +1,33 @@
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# run worker(worker_id, job_queue) on num_workers threads until the shared queue is drained
+def run_workers(jobs, worker, num_workers):
+    job_queue = queue.Queue()
+    for job in jobs:
+        job_queue.put(job)
+
+    num_workers = max(1, min(num_workers, len(jobs)))
+
+    def run(worker_id):
+        try:
+            worker(worker_id, job_queue)
+        except Exception as e:
+            logger.error(f"worker {worker_id} crashed: {e}", exc_info=True)
+
+    threads = [threading.Thread(target=run, args=(i,), name=f"worker-{i}", daemon=True) for i in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # anything left over (every worker crashed) is handed back to the caller
+    leftover = []
+    while True:
+        try:
+            leftover.append(job_queue.get_nowait())
+        except queue.Empty:
+            return leftover